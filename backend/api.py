@@ -1,8 +1,22 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Header, Query, Request
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+import asyncio
+import hmac
 import io
+import time
+import json
+import zipfile
 from .caption_generator import CaptionGenerator
+from .cache import CaptionCache, image_digest
+from .image_io import UploadError, load_image, probe_image, read_upload
+from .jobs import JobStore
+from .near_duplicates import NearDuplicateIndex
+from .inference_pool import InferencePool, QueueFullError
+from .metrics import record_quality_tier, record_request, render, stage_timer, track_inference_pool
+from .profiling import ProfilerBusyError, RequestProfiler
+from . import config
 import uvicorn
 
 app = FastAPI(title="AI Caption Generator API", version="1.0.0")
@@ -16,37 +30,667 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize caption generator
-caption_generator = CaptionGenerator()
+# Caption caches keyed by image content and generation parameters
+base_caption_cache = CaptionCache(
+    config.CAPTION_CACHE_PATH or None, "base_captions",
+    max_entries=config.CAPTION_CACHE_MEMORY_ENTRIES,
+    max_disk_entries=config.CAPTION_CACHE_DISK_ENTRIES,
+)
+enhanced_caption_cache = CaptionCache(
+    config.CAPTION_CACHE_PATH or None, "enhanced_captions",
+    max_entries=config.CAPTION_CACHE_MEMORY_ENTRIES,
+    max_disk_entries=config.CAPTION_CACHE_DISK_ENTRIES,
+)
+
+# Base captions of earlier images, looked up by perceptual hash
+near_duplicate_index = NearDuplicateIndex(
+    config.CAPTION_CACHE_PATH or None,
+    max_distance=config.NEAR_DUPLICATE_MAX_DISTANCE,
+    max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+) if config.NEAR_DUPLICATE_INDEX else None
+
+# Initialize caption generator; models load in the background after startup
+caption_generator = CaptionGenerator(
+    max_batch_size=config.BLIP_MAX_BATCH_SIZE,
+    batch_wait_ms=config.BLIP_BATCH_WAIT_MS,
+    base_cache=base_caption_cache,
+    enhanced_cache=enhanced_caption_cache,
+    lazy_load=True,
+    precision=config.MODEL_PRECISION,
+    engine=config.INFERENCE_ENGINE,
+    onnx_dir=config.ONNX_MODEL_DIR,
+    enhancer_by_format=config.ENHANCER_BY_FORMAT,
+    near_duplicates=near_duplicate_index,
+    stop_at_caption_end=config.GPT2_STOP_AT_CAPTION_END,
+    min_caption_chars=config.GPT2_MIN_CAPTION_CHARS,
+)
+
+# Model inference runs here instead of on the event loop
+inference_pool = InferencePool(
+    max_workers=config.INFERENCE_WORKERS,
+    max_queue=config.INFERENCE_MAX_QUEUE,
+)
+track_inference_pool(inference_pool)
+
+# Opt-in per-request profiling, see profiling_requested()
+request_profiler = RequestProfiler(
+    config.PROFILE_DIR,
+    max_traces=config.PROFILE_MAX_TRACES,
+)
+
+# Asynchronous caption jobs, processed by run_job_worker()
+job_store = JobStore(
+    config.JOB_STORE_PATH,
+    result_ttl=config.JOB_RESULT_TTL_SECONDS,
+    max_queued=config.JOB_MAX_QUEUED,
+)
+job_tasks: List[asyncio.Task] = []
+jobs_submitted: Optional[asyncio.Event] = None
+
+def busy_response(error: QueueFullError) -> JSONResponse:
+    """503 telling the client (or load balancer) to come back later"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(error.retry_after)},
+        content={
+            "success": False,
+            "error": "Server is busy, please retry later",
+            "caption": None
+        }
+    )
+
+def not_ready_response() -> JSONResponse:
+    """503 while the models are still loading (or failed to load)"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "5"},
+        content={
+            "success": False,
+            "error": f"Models are not ready ({caption_generator.load_state})",
+            "caption": None
+        }
+    )
+
+def upload_error_response(error: UploadError) -> JSONResponse:
+    """413/415/400 for an upload rejected before any decoding or model work"""
+    return JSONResponse(
+        status_code=error.status_code,
+        content={
+            "success": False,
+            "error": str(error),
+            "caption": None
+        }
+    )
+
+async def read_image_upload(image: UploadFile) -> bytes:
+    """Read an uploaded image within MAX_UPLOAD_BYTES and check its header against MAX_IMAGE_PIXELS"""
+    image_data = await read_upload(image, config.MAX_UPLOAD_BYTES)
+    probe_image(image_data, config.MAX_IMAGE_PIXELS)
+    return image_data
+
+# Room for multipart boundaries, part headers and form fields on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+def max_request_bytes(path: str) -> int:
+    """Largest request body an upload endpoint can legitimately receive"""
+    if path == "/generate-captions/bulk":
+        return config.BULK_MAX_TOTAL_BYTES + config.MAX_ARCHIVE_BYTES + MULTIPART_OVERHEAD_BYTES
+    return config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+
+@app.middleware("http")
+async def reject_oversized_bodies(request: Request, call_next):
+    """413 from the declared Content-Length, before the multipart body is received and spooled
+
+    Chunked requests carry no length; their files are still capped while
+    being read (read_upload).
+    """
+    content_length = request.headers.get("content-length")
+    if request.method == "POST" and content_length is not None:
+        try:
+            too_large = int(content_length) > max_request_bytes(request.url.path)
+        except ValueError:
+            return upload_error_response(UploadError(400, "Invalid Content-Length header"))
+        if too_large:
+            return upload_error_response(UploadError(413, f"Request body is larger than {max_request_bytes(request.url.path)} bytes"))
+    return await call_next(request)
+
+def count_request(format_type: str, outcome: str):
+    record_request(caption_generator.metrics_format(format_type), outcome)
+
+def decode_upload(image_data: bytes):
+    """load_image, timed as the decode stage"""
+    with stage_timer("decode"):
+        return load_image(image_data, max_pixels=config.MAX_IMAGE_PIXELS)
+
+def caption_image_bytes(image_data: bytes, format_type: str, seed: Optional[int] = None) -> str:
+    """Decode an uploaded image and caption it (runs on an inference worker)"""
+    pil_image = decode_upload(image_data)
+    return caption_generator.generate_caption(
+        pil_image, format_type, image_key=image_digest(image_data), seed=seed
+    )
+
+def caption_image_bytes_within(
+    image_data: bytes, format_type: str, seed: Optional[int], deadline: Optional[float]
+) -> Tuple[str, str]:
+    """caption_image_bytes scaled to a time.monotonic() deadline; returns (caption, quality tier)"""
+    pil_image = decode_upload(image_data)
+    return caption_generator.generate_caption_within(
+        pil_image, format_type, deadline, image_key=image_digest(image_data), seed=seed
+    )
+
+def profiling_requested(x_profile: Optional[str]) -> bool:
+    """Whether the X-Profile header asks for (and is allowed) a profiled request"""
+    if not config.PROFILING_ENABLED or not x_profile:
+        return False
+    if config.PROFILING_TOKEN:
+        return hmac.compare_digest(x_profile, config.PROFILING_TOKEN)
+    return x_profile.strip().lower() in ("1", "true", "yes", "on")
+
+def profile_caption_image_bytes(
+    image_data: bytes, format_type: str, seed: Optional[int], deadline: Optional[float]
+) -> Tuple[str, str, str]:
+    """caption_image_bytes_within under torch.profiler, skipping caches and batching; returns (caption, tier, trace id)"""
+    with request_profiler.profile("generate_caption") as trace_id:
+        pil_image = decode_upload(image_data)
+        caption, tier = caption_generator.generate_caption_within(pil_image, format_type, deadline, seed=seed, direct=True)
+    return caption, tier, trace_id
+
+def caption_image_bytes_all_formats(image_data: bytes, format_types: List[str], seed: Optional[int] = None) -> Dict[str, str]:
+    """Decode an uploaded image and caption it in several formats (runs on an inference worker)"""
+    pil_image = decode_upload(image_data)
+    return caption_generator.generate_all_captions(
+        pil_image, format_types, image_key=image_digest(image_data), seed=seed
+    )
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+def zip_entry_loader(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Callable[[], bytes]:
+    """Inflate one archive entry when called, refusing entries declared over MAX_UPLOAD_BYTES"""
+    def load() -> bytes:
+        # zipfile never inflates past the declared size, so checking it is enough to stop a zip bomb
+        if info.file_size > config.MAX_UPLOAD_BYTES:
+            raise UploadError(413, f"Upload is larger than {config.MAX_UPLOAD_BYTES} bytes")
+        return archive.read(info)
+    return load
+
+def list_zip_images(archive_data: bytes) -> Tuple[List[Tuple[str, Callable[[], bytes]]], int]:
+    """Image entries of a zip archive as (name, loader) plus their total declared size, skipping folders and other files
+
+    Nothing is inflated here; each loader inflates its entry when the entry
+    is captioned.
+    """
+    archive = zipfile.ZipFile(io.BytesIO(archive_data))
+    images = []
+    inflated_bytes = 0
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith('__MACOSX/') or not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        images.append((name, zip_entry_loader(archive, info)))
+        inflated_bytes += info.file_size
+    return images, inflated_bytes
+
+def caption_loaded_image(load: Callable[[], bytes], format_type: str, seed: Optional[int]) -> str:
+    """Load a bulk item's bytes and caption them, both on the inference worker"""
+    return caption_image_bytes(load(), format_type, seed)
+
+async def run_when_accepted(fn, *args):
+    """Run on the inference pool, waiting for room instead of failing when it is full"""
+    while True:
+        try:
+            return await inference_pool.run(fn, *args)
+        except QueueFullError:
+            await asyncio.sleep(0.1)
+
+async def stream_bulk_captions(
+    items: List[Tuple[str, Callable[[], bytes]]],
+    format_type: str,
+    seed: Optional[int]
+) -> AsyncIterator[str]:
+    """Caption items concurrently and yield one NDJSON line per item as it finishes
+
+    Each item is (name, loader); only items in flight hold their bytes.
+    """
+    async def caption_item(index: int, name: str, load: Callable[[], bytes]) -> Dict:
+        try:
+            caption = await run_when_accepted(caption_loaded_image, load, format_type, seed)
+            count_request(format_type, "success")
+            return {"index": index, "image_name": name, "success": True, "caption": caption, "format": format_type}
+        except Exception as e:
+            count_request(format_type, "error")
+            return {"index": index, "image_name": name, "success": False, "error": str(e), "caption": None}
+    
+    remaining = iter(enumerate(items))
+    pending = set()
+    succeeded = failed = 0
+    
+    while True:
+        # Keep a bounded window of items in flight so one bulk request can't flood the pool
+        while len(pending) < config.BULK_MAX_IN_FLIGHT:
+            next_item = next(remaining, None)
+            if next_item is None:
+                break
+            index, (name, load) = next_item
+            pending.add(asyncio.ensure_future(caption_item(index, name, load)))
+        
+        if not pending:
+            break
+        
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result = task.result()
+            if result["success"]:
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(result) + "\n"
+    
+    yield json.dumps({"done": True, "total": len(items), "succeeded": succeeded, "failed": failed}) + "\n"
+
+def caption_job(image_data: bytes, format_types: List[str], seed: Optional[int]) -> Dict[str, str]:
+    """Caption a job's image in its formats (runs on an inference worker)"""
+    if len(format_types) == 1:
+        return {format_types[0]: caption_image_bytes(image_data, format_types[0], seed)}
+    return caption_image_bytes_all_formats(image_data, format_types, seed)
+
+async def run_job_worker():
+    """Claim queued jobs from the store one at a time and caption them once the models are ready"""
+    while True:
+        if not caption_generator.is_ready:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+            continue
+        
+        # Cleared before claiming, so a job submitted while claim() runs still sets it for the wait below
+        jobs_submitted.clear()
+        job = await asyncio.to_thread(job_store.claim)
+        if job is None:
+            # Woken early by a submission to this process; other processes' jobs are found by polling
+            try:
+                await asyncio.wait_for(jobs_submitted.wait(), config.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        job_id, image_data, format_types, seed = job
+        try:
+            captions = await run_when_accepted(caption_job, image_data, format_types, seed)
+        except Exception as e:
+            for format_type in format_types:
+                count_request(format_type, "error")
+            await asyncio.to_thread(job_store.finish, job_id, error=str(e))
+        else:
+            for format_type in format_types:
+                count_request(format_type, "success")
+            await asyncio.to_thread(job_store.finish, job_id, captions)
+
+async def expire_jobs():
+    """Delete finished jobs once their results outlive JOB_RESULT_TTL_SECONDS"""
+    while True:
+        await asyncio.to_thread(job_store.delete_expired)
+        await asyncio.sleep(min(60, max(1, config.JOB_RESULT_TTL_SECONDS)))
+
+def sse_event(event: str, data: Dict) -> str:
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_caption_events(events: asyncio.Queue, format_type: str) -> AsyncIterator[str]:
+    """Forward events produced on the inference worker as SSE messages"""
+    while True:
+        event = await events.get()
+        if event is None:
+            break
+        kind, payload = event
+        if kind == "base":
+            yield sse_event("base", {"base_caption": payload})
+        elif kind == "token":
+            yield sse_event("token", {"text": payload})
+        elif kind == "caption":
+            yield sse_event("caption", {"success": True, "caption": payload, "format": format_type})
+        else:
+            yield sse_event("error", {"success": False, "error": payload, "caption": None})
+
+@app.on_event("startup")
+def start_model_loading():
+    if caption_generator.load_state == "not_loaded":
+        caption_generator.load_in_background(warm_up=config.MODEL_WARMUP)
+
+@app.on_event("startup")
+async def start_job_workers():
+    global jobs_submitted
+    jobs_submitted = asyncio.Event()
+    # Jobs a crashed or restarted process was running go back in the queue
+    await asyncio.to_thread(job_store.requeue_orphaned)
+    job_tasks.extend(asyncio.ensure_future(run_job_worker()) for _ in range(max(0, config.JOB_WORKERS)))
+    job_tasks.append(asyncio.ensure_future(expire_jobs()))
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    for task in job_tasks:
+        task.cancel()
+    await asyncio.gather(*job_tasks, return_exceptions=True)
+    job_tasks.clear()
+
+@app.on_event("shutdown")
+def shutdown_inference_pool():
+    inference_pool.shutdown()
 
 @app.post("/generate-caption")
 async def generate_caption(
     image: UploadFile = File(...),
-    format_type: str = Form(default="casual")
+    format_type: str = Form(default="casual"),
+    seed: Optional[int] = Form(default=None),
+    deadline_ms: Optional[int] = Form(default=None),
+    x_profile: Optional[str] = Header(default=None)
 ):
-    """Generate caption for uploaded image"""
+    """Generate caption for uploaded image
+
+    Pass ``seed`` (or set CAPTION_SEED) for reproducible, cacheable captions.
+    ``deadline_ms`` (or DEFAULT_DEADLINE_MS) is a latency budget: decoding
+    effort is reduced, or GPT-2 skipped, to answer in time, and
+    ``quality_tier`` says what was served.
+    With profiling enabled, an ``X-Profile`` header runs the request under
+    torch.profiler and returns ``profile_id`` for ``GET /profiles/{id}``.
+    """
+    # The budget covers queueing for a worker as well as decoding and generation
+    received_at = time.monotonic()
+    if not caption_generator.is_ready:
+        count_request(format_type, "not_ready")
+        return not_ready_response()
+    
     try:
-        # Read and process image
-        image_data = await image.read()
-        pil_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        if seed is None:
+            seed = config.CAPTION_SEED
+        if deadline_ms is None:
+            deadline_ms = config.DEFAULT_DEADLINE_MS or None
+        deadline = received_at + deadline_ms / 1000 if deadline_ms else None
         
-        # Generate caption
-        caption = caption_generator.generate_caption(pil_image, format_type)
+        # Read and check the image, then decode and caption it off the event loop
+        image_data = await read_image_upload(image)
+        
+        profile = {}
+        caption = None
+        if profiling_requested(x_profile):
+            try:
+                caption, tier, profile["profile_id"] = await inference_pool.run(
+                    profile_caption_image_bytes, image_data, format_type, seed, deadline
+                )
+            except ProfilerBusyError as e:
+                # Still caption the image, just without a trace
+                profile = {"profile_id": None, "profile_error": str(e)}
+        if caption is None:
+            caption, tier = await inference_pool.run(caption_image_bytes_within, image_data, format_type, seed, deadline)
+        count_request(format_type, "success")
+        record_quality_tier(tier)
         
         return {
             "success": True,
             "caption": caption,
             "format": format_type,
-            "image_name": image.filename
+            "seed": seed,
+            "quality_tier": tier,
+            "deadline_ms": deadline_ms,
+            "image_name": image.filename,
+            **profile
         }
         
+    except UploadError as e:
+        count_request(format_type, "rejected")
+        return upload_error_response(e)
+    except QueueFullError as e:
+        count_request(format_type, "busy")
+        return busy_response(e)
     except Exception as e:
+        count_request(format_type, "error")
         return {
             "success": False,
             "error": str(e),
             "caption": None
         }
 
+@app.post("/generate-caption/stream")
+async def generate_caption_stream(
+    image: UploadFile = File(...),
+    format_type: str = Form(default="casual"),
+    seed: Optional[int] = Form(default=None)
+):
+    """Generate caption for uploaded image as a Server-Sent Events stream
+
+    Sends a ``base`` event with the BLIP caption as soon as it is ready,
+    ``token`` events with GPT-2 text as it is decoded, and a final ``caption``
+    event with the cleaned, formatted caption (or an ``error`` event).
+    """
+    if not caption_generator.is_ready:
+        count_request(format_type, "not_ready")
+        return not_ready_response()
+    
+    try:
+        if seed is None:
+            seed = config.CAPTION_SEED
+        
+        image_data = await read_image_upload(image)
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        
+        def emit(kind: str, payload: str):
+            loop.call_soon_threadsafe(events.put_nowait, (kind, payload))
+        
+        def produce():
+            try:
+                pil_image = decode_upload(image_data)
+                caption = caption_generator.stream_caption(
+                    pil_image, format_type, emit, image_key=image_digest(image_data), seed=seed
+                )
+                count_request(format_type, "success")
+                emit("caption", caption)
+            except Exception as e:
+                count_request(format_type, "error")
+                emit("error", str(e))
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+        
+        # Submit before responding so a full queue still gets a proper 503
+        inference_pool.submit(produce)
+        
+    except UploadError as e:
+        count_request(format_type, "rejected")
+        return upload_error_response(e)
+    except QueueFullError as e:
+        count_request(format_type, "busy")
+        return busy_response(e)
+    except Exception as e:
+        count_request(format_type, "error")
+        return {
+            "success": False,
+            "error": str(e),
+            "caption": None
+        }
+    
+    return StreamingResponse(
+        stream_caption_events(events, format_type),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate-all-captions")
+async def generate_all_captions(
+    image: UploadFile = File(...),
+    formats: Optional[str] = Form(default=None),
+    seed: Optional[int] = Form(default=None)
+):
+    """Generate captions in several formats (comma-separated, default all) from one model pass"""
+    if not caption_generator.is_ready:
+        record_request("all", "not_ready")
+        return not_ready_response()
+    
+    try:
+        if seed is None:
+            seed = config.CAPTION_SEED
+        
+        format_types = list(caption_generator.format_templates.keys())
+        if formats:
+            format_types = [f.strip() for f in formats.split(',') if f.strip()]
+            unknown = [f for f in format_types if f not in caption_generator.format_templates]
+            if unknown:
+                return {
+                    "success": False,
+                    "error": f"Unknown formats: {', '.join(unknown)}",
+                    "captions": None
+                }
+        
+        image_data = await read_image_upload(image)
+        captions = await inference_pool.run(caption_image_bytes_all_formats, image_data, format_types, seed)
+        for format_type in format_types:
+            count_request(format_type, "success")
+        
+        return {
+            "success": True,
+            "captions": captions,
+            "seed": seed,
+            "image_name": image.filename
+        }
+        
+    except UploadError as e:
+        record_request("all", "rejected")
+        return upload_error_response(e)
+    except QueueFullError as e:
+        record_request("all", "busy")
+        return busy_response(e)
+    except Exception as e:
+        record_request("all", "error")
+        return {
+            "success": False,
+            "error": str(e),
+            "captions": None
+        }
+
+@app.post("/generate-captions/bulk")
+async def generate_captions_bulk(
+    images: List[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(default=None),
+    format_type: str = Form(default="casual"),
+    seed: Optional[int] = Form(default=None)
+):
+    """Caption many images (files and/or a zip archive), streaming NDJSON results as they finish
+
+    Each line is one image's result with its ``index`` in the upload order; a
+    failing image is reported on its own line without aborting the batch. The
+    last line is a ``{"done": true, ...}`` summary. Uploaded files plus the
+    archive's inflated entries may total at most BULK_MAX_TOTAL_BYTES, and
+    at most BULK_MAX_IMAGES images (413 otherwise); archive entries are
+    inflated one at a time as they are captioned.
+    """
+    if not caption_generator.is_ready:
+        count_request(format_type, "not_ready")
+        return not_ready_response()
+    
+    try:
+        if seed is None:
+            seed = config.CAPTION_SEED
+        
+        # Bad images are reported on their own line when decoded; only the size and count caps reject the whole request
+        if len(images) > config.BULK_MAX_IMAGES:
+            raise UploadError(413, f"Bulk upload has more than {config.BULK_MAX_IMAGES} images")
+        items = []
+        total_bytes = 0
+        for upload in images:
+            image_data = await read_upload(upload, config.MAX_UPLOAD_BYTES, sniff=False)
+            total_bytes += len(image_data)
+            if total_bytes > config.BULK_MAX_TOTAL_BYTES:
+                raise UploadError(413, f"Bulk upload is larger than {config.BULK_MAX_TOTAL_BYTES} bytes")
+            items.append((upload.filename, lambda image_data=image_data: image_data))
+        
+        if archive is not None:
+            archive_data = await read_upload(archive, config.MAX_ARCHIVE_BYTES, sniff=False)
+            entries, inflated_bytes = await asyncio.to_thread(list_zip_images, archive_data)
+            if len(items) + len(entries) > config.BULK_MAX_IMAGES:
+                raise UploadError(413, f"Bulk upload has more than {config.BULK_MAX_IMAGES} images")
+            if total_bytes + inflated_bytes > config.BULK_MAX_TOTAL_BYTES:
+                raise UploadError(413, f"Bulk upload inflates to more than {config.BULK_MAX_TOTAL_BYTES} bytes")
+            items += entries
+        
+        if not items:
+            return {"success": False, "error": "No images provided", "caption": None}
+        
+    except UploadError as e:
+        count_request(format_type, "rejected")
+        return upload_error_response(e)
+    except zipfile.BadZipFile:
+        count_request(format_type, "rejected")
+        return {"success": False, "error": "Archive is not a valid zip file", "caption": None}
+    
+    return StreamingResponse(
+        stream_bulk_captions(items, format_type, seed),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/jobs")
+async def submit_job(
+    image: UploadFile = File(...),
+    format_type: str = Form(default="casual"),
+    formats: Optional[str] = Form(default=None),
+    seed: Optional[int] = Form(default=None)
+):
+    """Queue a caption job and return its id right away (202); poll ``GET /jobs/{id}`` for the result
+
+    ``formats`` (comma-separated) captions the image in several formats,
+    otherwise ``format_type`` is used. Jobs are accepted while the models
+    are still loading and are persisted, so they survive a restart.
+    """
+    if seed is None:
+        seed = config.CAPTION_SEED
+    
+    format_types = [format_type]
+    if formats:
+        format_types = [f.strip() for f in formats.split(',') if f.strip()]
+    unknown = [f for f in format_types if f not in caption_generator.format_templates]
+    if unknown or not format_types:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "error": f"Unknown formats: {', '.join(unknown) or formats}", "job_id": None}
+        )
+    
+    try:
+        image_data = await read_image_upload(image)
+    except UploadError as e:
+        return upload_error_response(e)
+    job_id = await asyncio.to_thread(job_store.submit, image_data, format_types, seed, image.filename)
+    if job_id is None:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "30"},
+            content={"success": False, "error": "Too many queued jobs, please retry later", "job_id": None}
+        )
+    jobs_submitted.set()
+    
+    return JSONResponse(
+        status_code=202,
+        headers={"Location": f"/jobs/{job_id}"},
+        content={"success": True, "job_id": job_id, "status": "queued", "formats": format_types, "seed": seed}
+    )
+
+@app.get("/jobs")
+async def get_jobs(ids: str = Query(..., description="Comma-separated job ids")):
+    """Status and results of many jobs in one call; unknown or expired ids are listed in ``missing``"""
+    job_ids = list(dict.fromkeys(i.strip() for i in ids.split(',') if i.strip()))
+    if len(job_ids) > config.JOB_BATCH_MAX_IDS:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "error": f"At most {config.JOB_BATCH_MAX_IDS} job ids per request"}
+        )
+    jobs = await asyncio.to_thread(job_store.get_many, job_ids)
+    return {
+        "jobs": [jobs[job_id] for job_id in job_ids if job_id in jobs],
+        "missing": [job_id for job_id in job_ids if job_id not in jobs]
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a job: queued, running, succeeded (with ``captions``) or failed (with ``error``)"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Job not found"})
+    return job
+
 @app.get("/formats")
 async def get_formats():
     """Get available caption formats"""
@@ -61,7 +705,54 @@ async def get_formats():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "AI Caption Generator API is running"}
+    if caption_generator.is_ready:
+        return {"status": "healthy", "message": "AI Caption Generator API is running"}
+    return {
+        "status": "failed" if caption_generator.load_state == "failed" else "starting",
+        "message": "AI Caption Generator models are not ready",
+        "models": caption_generator.load_progress()
+    }
+
+@app.get("/live")
+async def liveness():
+    """Liveness probe: the process is up and the event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once models are loaded and warmed up, 503 with progress before that"""
+    progress = caption_generator.load_progress()
+    if caption_generator.is_ready:
+        return {"status": "ready", "models": progress}
+    return JSONResponse(status_code=503, content={"status": "not_ready", "models": progress})
+
+@app.get("/load")
+async def load_status():
+    """Inference queue depth and in-flight count for load balancing, plus job counts by status"""
+    return {**inference_pool.stats(), "jobs": await asyncio.to_thread(job_store.stats)}
+
+@app.get("/profiles/{trace_id}")
+async def get_profile(trace_id: str, x_profile: Optional[str] = Header(default=None)):
+    """Download a Chrome/Perfetto trace saved by a profiled request (same X-Profile header)"""
+    path = request_profiler.trace_path(trace_id) if profiling_requested(x_profile) else None
+    if path is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Profile not found"})
+    return FileResponse(path, media_type="application/json", filename=f"{trace_id}.json")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency, request outcomes, fallbacks, tokens/s, in-flight requests, RSS"""
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters for the caption caches and the near-duplicate index"""
+    return {
+        "base_captions": base_caption_cache.stats(),
+        "enhanced_captions": enhanced_caption_cache.stats(),
+        "near_duplicates": near_duplicate_index.stats() if near_duplicate_index is not None else None
+    }
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
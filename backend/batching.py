@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """Gather items submitted from many threads and run them through one batched call
+
+    The worker thread takes the first queued item, then keeps collecting until
+    either ``max_batch_size`` items are waiting or ``max_wait_ms`` has passed,
+    calls ``batch_fn`` once with all of them and hands each result back to the
+    future of the caller that submitted it.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch and return a future for its result"""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_worker(self):
+        """Start the batching thread on first use"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> List[Tuple[Any, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+
+            # Drop entries whose caller already gave up
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
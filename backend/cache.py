@@ -0,0 +1,116 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def image_digest(image_data: bytes) -> str:
+    """Content hash of the raw uploaded image bytes"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """Stable cache key from an image digest / caption and generation parameters"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class CaptionCache:
+    """Size-bounded in-memory LRU in front of a persistent SQLite table
+
+    Each instance owns one table, so base captions and style-enhanced captions
+    can share a database file while keeping separate LRUs and counters. Pass
+    ``path=None`` for a memory-only cache.
+    """
+
+    def __init__(self, path: Optional[str], table: str, max_entries: int = 1024, max_disk_entries: int = 100000):
+        self.table = table
+        self.max_entries = max(1, max_entries)
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._writes_since_prune = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """SQLite connection, opened lazily and reopened in forked worker processes"""
+        if not self.path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            # A connection must never be carried across fork()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created_at ON {self.table} (created_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._remember(key, value)
+
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, time.time())
+                )
+                self._prune_disk()
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory)}
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _prune_disk(self):
+        """Drop the oldest rows once the table outgrows its bound (checked every 100 writes)"""
+        self._writes_since_prune += 1
+        if not self.max_disk_entries or self._writes_since_prune < 100:
+            return
+        self._writes_since_prune = 0
+        count = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY created_at LIMIT ?)",
+                (excess,)
+            )
+            self._stats["disk_evictions"] += excess
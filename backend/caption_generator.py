@@ -1,23 +1,126 @@
 import torch
-from transformers import BlipProcessor, BlipForConditionalGeneration, GPT2LMHeadModel, GPT2Tokenizer
+from transformers import BlipConfig, BlipProcessor, GPT2Config, GPT2TokenizerFast, StoppingCriteriaList, TextStreamer
 from PIL import Image
 import requests
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 import re
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .batching import MicroBatcher
+from .cache import CaptionCache, make_key
+from .engines import ENGINES, InferenceEngine, OnnxEngine, TorchEngine
+from .enhancers import ENHANCERS, GPT2_ENHANCER, CaptionEnhancer
+from .latency_budget import DeadlineExceeded, LatencyEstimator
+from .metrics import record_base_fallback, record_fallback, record_near_duplicate_lookup, record_tokens, stage_timer
+from .near_duplicates import NearDuplicateIndex, dhash, distinctive
+from .precision import PRECISION_MODES
+from .seed_lock import SharedExclusiveLock
+from .stopping import SentenceStoppingCriteria, caption_end
+
+class CallbackStreamer(TextStreamer):
+    """Hand each decoded chunk of GPT-2 output to a callback instead of printing it"""
+
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.on_text(text)
 
 class CaptionGenerator:
-    def __init__(self):
+    BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+    GPT2_MODEL_NAME = "gpt2"
+    FALLBACK_BASE_CAPTION = "A beautiful moment captured in this image"
+    LOAD_STEPS = 5
+
+    def __init__(
+        self,
+        max_batch_size: int = 8,
+        batch_wait_ms: float = 10.0,
+        base_cache: Optional[CaptionCache] = None,
+        enhanced_cache: Optional[CaptionCache] = None,
+        lazy_load: bool = False,
+        precision: str = "fp32",
+        engine: str = "torch",
+        onnx_dir: str = "./cache/onnx",
+        enhancer_by_format: Optional[Dict[str, str]] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        stop_at_caption_end: bool = True,
+        min_caption_chars: int = 20,
+    ):
+        """Set up the generator; with ``lazy_load`` the models are only loaded by ``load_models()``
+
+        ``precision`` is one of fp32, int8 (dynamic quantization of Linear
+        layers, CPU only) or bf16 (where the hardware supports it) and applies
+        to the torch engine. ``engine="onnx"`` runs the models exported to
+        ``onnx_dir`` on ONNX Runtime instead, always in fp32. ``enhancer_by_format`` maps
+        formats to an enhancer other than GPT-2 (e.g. ``{'formal': 'template'}``).
+        With ``near_duplicates`` a base caption is reused for images that are
+        perceptually close to one captioned before. ``stop_at_caption_end``
+        ends GPT-2 sampling at the first sentence end, newline or run of
+        hashtags after ``min_caption_chars`` characters.
+        """
+        if precision not in PRECISION_MODES:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISION_MODES)}")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+        if engine == "onnx" and precision != "fp32":
+            raise ValueError(f"Precision {precision!r} is only supported by the torch engine; the onnx engine runs in fp32")
+        enhancer_names = (GPT2_ENHANCER, *ENHANCERS)
+        for format_type, name in (enhancer_by_format or {}).items():
+            if name not in enhancer_names:
+                raise ValueError(f"Unknown enhancer {name!r} for {format_type}, expected one of {', '.join(enhancer_names)}")
+        
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.precision = precision
+        self.engine_name = engine
+        self.onnx_dir = onnx_dir
+        self.model_memory: Dict[str, int] = {}
         
-        # Load BLIP model for image captioning
-        self.blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        self.blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-        self.blip_model.to(self.device)
+        # Tokenizers and engine are filled in by load_models()
+        self.blip_processor = None
+        self.gpt2_tokenizer = None
+        self.engine: Optional[InferenceEngine] = None
+        # Per-format (prefix token ids, past key/values) for the fixed part of the GPT-2 prompt
+        self.prompt_prefix_cache: Dict[str, tuple] = {}
+        self.load_state = "not_loaded"
+        self.load_steps_done = 0
+        self.load_error: Optional[str] = None
+        self.load_started_at: Optional[float] = None
+        self.load_finished_at: Optional[float] = None
         
-        # Load GPT-2 for text enhancement
-        self.gpt2_tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-        self.gpt2_model = GPT2LMHeadModel.from_pretrained("gpt2")
-        self.gpt2_tokenizer.pad_token = self.gpt2_tokenizer.eos_token
+        # Concurrent callers of generate_base_caption share one BLIP pass
+        self.base_caption_batcher = None
+        if max_batch_size > 1:
+            self.base_caption_batcher = MicroBatcher(self.generate_base_captions, max_batch_size, batch_wait_ms)
+        
+        # Optional caches; enhanced captions are only cached for seeded requests
+        self.base_cache = base_cache
+        self.enhanced_cache = enhanced_cache
+        self._seed_lock = SharedExclusiveLock()
+        
+        # Decoding parameters, also part of the cache keys
+        self.blip_generate_kwargs = {'max_length': 50, 'num_beams': 5}
+        self.gpt2_max_new_tokens = 50
+        self.gpt2_temperature = 0.8
+        self.stop_at_caption_end = stop_at_caption_end
+        self.min_caption_chars = min_caption_chars
+        
+        # Decoding effort per quality tier when a request has a deadline, see generate_caption_within()
+        self.quality_tiers = {
+            'full': {'num_beams': self.blip_generate_kwargs['num_beams'], 'max_new_tokens': self.gpt2_max_new_tokens},
+            'reduced': {'num_beams': 1, 'max_new_tokens': 20}
+        }
+        self.latency = LatencyEstimator()
+        self.near_duplicates = near_duplicates
+        
+        # Formats served by a non-GPT-2 enhancer
+        self.enhancers: Dict[str, CaptionEnhancer] = {
+            format_type: ENHANCERS[name]()
+            for format_type, name in (enhancer_by_format or {}).items() if name != GPT2_ENHANCER
+        }
         
         # Format templates
         self.format_templates = {
@@ -58,60 +161,373 @@ class CaptionGenerator:
                 'hashtags': ['#inspiration', '#motivation', '#believe', '#dreams']
             }
         }
+        
+        if not lazy_load:
+            self.load_models()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.load_state == "ready"
+
+    def _advance_load(self, state: str):
+        self.load_state = state
+        self.load_steps_done += 1
+
+    def load_models(self, warm_up: bool = False):
+        """Load BLIP and GPT-2 weights, optionally followed by a warm-up pass"""
+        self.load_started_at = time.time()
+        self.load_steps_done = 0
+        
+        # Load BLIP model for image captioning
+        self.load_state = "loading_blip_processor"
+        self.blip_processor = BlipProcessor.from_pretrained(self.BLIP_MODEL_NAME)
+        self.engine = self.create_engine()
+        self._advance_load("loading_blip_model")
+        self.engine.load_blip()
+        
+        # Load GPT-2 for text enhancement
+        self._advance_load("loading_gpt2_tokenizer")
+        self.gpt2_tokenizer = GPT2TokenizerFast.from_pretrained(self.GPT2_MODEL_NAME)
+        self.gpt2_tokenizer.pad_token = self.gpt2_tokenizer.eos_token
+        self.gpt2_tokenizer.padding_side = 'left'
+        self._advance_load("loading_gpt2_model")
+        self.engine.load_gpt2()
+        self.build_prompt_prefix_cache()
+        
+        self.model_memory = self.engine.memory_bytes()
+        
+        # Not ready until the warm-up pass is through
+        self._advance_load("warming_up")
+        if warm_up:
+            self.warm_up()
+        
+        self._advance_load("ready")
+        self.load_finished_at = time.time()
+
+    def create_engine(self) -> InferenceEngine:
+        if self.engine_name == "onnx":
+            return OnnxEngine(
+                self.onnx_dir,
+                BlipConfig.from_pretrained(self.BLIP_MODEL_NAME),
+                GPT2Config.from_pretrained(self.GPT2_MODEL_NAME).eos_token_id,
+                intra_op_threads=torch.get_num_threads()
+            )
+        return TorchEngine(self.BLIP_MODEL_NAME, self.GPT2_MODEL_NAME, self.device, self.precision)
+
+    def warm_up(self):
+        """Run one synthetic inference so real requests don't pay one-time setup costs"""
+        image = Image.new('RGB', (384, 384), (128, 128, 128))
+        base_caption = self.generate_base_captions([image])[0]
+        self.enhance_caption(base_caption, 'casual')
+        # Also seeds the latency estimate of the reduced tier's greedy BLIP pass
+        self.generate_base_captions([image], num_beams=self.quality_tiers['reduced']['num_beams'])
+
+    def share_memory(self):
+        """Move model weights into shared memory so forked worker processes map the same pages"""
+        self.engine.share_memory()
+        for _, past_key_values in self.prompt_prefix_cache.values():
+            if isinstance(past_key_values, tuple):
+                for layer in past_key_values:
+                    for tensor in layer:
+                        tensor.share_memory_()
+
+    def load_in_background(self, warm_up: bool = True) -> threading.Thread:
+        """Load (and warm up) the models on a background thread so the server can start serving probes"""
+        def run():
+            try:
+                self.load_models(warm_up=warm_up)
+            except Exception as e:
+                print(f"Error loading models: {e}")
+                self.load_state = "failed"
+                self.load_error = str(e)
+        
+        thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def load_progress(self) -> Dict:
+        """Model loading state for readiness probes"""
+        elapsed = None
+        if self.load_started_at is not None:
+            elapsed = round((self.load_finished_at or time.time()) - self.load_started_at, 2)
+        return {
+            "state": self.load_state,
+            "progress": round(self.load_steps_done / self.LOAD_STEPS, 2),
+            "elapsed_seconds": elapsed,
+            "error": self.load_error,
+            "engine": self.engine_name,
+            "precision": self.precision,
+            "memory_mb": {name: round(size / 2**20, 1) for name, size in self.model_memory.items()}
+        }
 
-    def generate_base_caption(self, image: Image.Image) -> str:
-        """Generate base caption from image using BLIP model"""
+    def generate_base_caption(self, image: Image.Image, timeout: Optional[float] = None) -> str:
+        """Generate base caption from image using BLIP model
+
+        With ``timeout`` (seconds, batching wait included) the fallback base
+        caption is returned once it runs out.
+        """
+        if self.base_caption_batcher is not None:
+            future = self.base_caption_batcher.submit(image)
+            try:
+                return future.result(timeout=max(0.0, timeout) if timeout is not None else None)
+            except FutureTimeoutError:
+                # The batch still finishes for the other callers in it
+                future.cancel()
+                return self.FALLBACK_BASE_CAPTION
+        return self.generate_base_captions([image], max_time=timeout)[0]
+
+    def generate_base_captions(
+        self,
+        images: List[Image.Image],
+        num_beams: Optional[int] = None,
+        max_time: Optional[float] = None,
+    ) -> List[str]:
+        """Generate base captions for a batch of images with a single BLIP pass
+
+        ``num_beams`` overrides the configured beam count. A search that runs
+        into ``max_time`` (seconds) is cut short and returns the fallback base
+        caption, since its text stops mid-sentence.
+        """
         try:
-            inputs = self.blip_processor(image, return_tensors="pt").to(self.device)
-            
-            with torch.no_grad():
-                out = self.blip_model.generate(**inputs, max_length=50, num_beams=5)
+            generate_kwargs = dict(self.blip_generate_kwargs)
+            if num_beams is not None:
+                generate_kwargs['num_beams'] = num_beams
             
-            caption = self.blip_processor.decode(out[0], skip_special_tokens=True)
-            return caption
+            with stage_timer("blip"):
+                start = time.perf_counter()
+                inputs = self.blip_processor(images, return_tensors="pt")
+                out = self.engine.generate_base(inputs['pixel_values'], max_time=max_time, **generate_kwargs)
+                elapsed = time.perf_counter() - start
+                if max_time is not None and elapsed >= max_time:
+                    return [self.FALLBACK_BASE_CAPTION] * len(images)
+                self.latency.observe_blip(generate_kwargs['num_beams'], elapsed)
+                
+                return self.blip_processor.batch_decode(out, skip_special_tokens=True)
         except Exception as e:
             print(f"Error generating base caption: {e}")
-            return "A beautiful moment captured in this image"
+            record_base_fallback(len(images))
+            return [self.FALLBACK_BASE_CAPTION] * len(images)
 
-    def enhance_caption(self, base_caption: str, format_type: str) -> str:
-        """Enhance caption based on format type"""
-        try:
-            template = self.format_templates.get(format_type, self.format_templates['casual'])
-            
-            # Create prompt for GPT-2
-            prompt = f"Transform this image description into a {template['style']} social media caption: {base_caption}\n\nCaption:"
-            
-            # Tokenize and generate
-            inputs = self.gpt2_tokenizer.encode(prompt, return_tensors="pt", max_length=100, truncation=True)
-            
-            with torch.no_grad():
-                outputs = self.gpt2_model.generate(
-                    inputs,
-                    max_length=inputs.shape[1] + 50,
-                    num_return_sequences=1,
-                    temperature=0.8,
-                    do_sample=True,
-                    pad_token_id=self.gpt2_tokenizer.eos_token_id
-                )
-            
-            generated_text = self.gpt2_tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
+    def prompt_prefix(self, template: Dict) -> str:
+        """Fixed, per-format start of the GPT-2 prompt"""
+        return f"Transform this image description into a {template['style']} social media caption:"
+
+    def prompt_suffix(self, base_caption: str) -> str:
+        """Per-request end of the GPT-2 prompt"""
+        return f" {base_caption}\n\nCaption:"
+
+    def build_prompt(self, base_caption: str, template: Dict) -> str:
+        """GPT-2 prompt asking for a caption in the template's style"""
+        return self.prompt_prefix(template) + self.prompt_suffix(base_caption)
+
+    def build_prompt_prefix_cache(self):
+        """Precompute GPT-2 past key/values for every format's prompt prefix
+
+        The prefix only depends on the format, so requests just prefill the
+        base caption suffix on top of the cached attention state.
+        """
+        self.prompt_prefix_cache = {}
+        for format_type, template in self.format_templates.items():
+            prefix_ids = self.gpt2_tokenizer.encode(self.prompt_prefix(template), return_tensors="pt")
+            self.prompt_prefix_cache[format_type] = (prefix_ids, self.engine.prefill(prefix_ids))
+
+    def encode_prompt(self, base_caption: str, format_type: str):
+        """Token ids for the full prompt, plus the cached prefix past key/values when available"""
+        template = self.format_templates.get(format_type, self.format_templates['casual'])
+        
+        if format_type not in self.prompt_prefix_cache:
+            prompt = self.build_prompt(base_caption, template)
+            return self.gpt2_tokenizer.encode(prompt, return_tensors="pt", max_length=100, truncation=True), None
+        
+        # Keep the original 100-token prompt limit; only the suffix can be truncated
+        prefix_ids, past_key_values = self.prompt_prefix_cache[format_type]
+        suffix_ids = self.gpt2_tokenizer.encode(
+            self.prompt_suffix(base_caption), return_tensors="pt",
+            max_length=max(1, 100 - prefix_ids.shape[1]), truncation=True
+        )
+        return torch.cat([prefix_ids, suffix_ids], dim=1), past_key_values
+
+    def finish_caption(self, generated_text: str, template: Dict, stopped_early: bool = False) -> str:
+        """Turn raw GPT-2 output into the final formatted caption
+
+        ``stopped_early`` says the stopping criterion fired for this text; only
+        then is what was sampled past the caption's end dropped. Output that
+        ran to the token budget is cleaned exactly as without early stopping.
+        """
+        with stage_timer("postprocess"):
             # Extract caption part
             caption_start = generated_text.find("Caption:") + len("Caption:")
-            enhanced_caption = generated_text[caption_start:].strip()
+            enhanced_caption = generated_text[caption_start:]
+            
+            # Drop what was sampled after the caption was complete: at most a token, or a batch
+            # row's tokens sampled while the slower rows were still finishing
+            if stopped_early:
+                end = caption_end(enhanced_caption, self.min_caption_chars)
+                if end is not None:
+                    enhanced_caption = enhanced_caption[:end]
+            enhanced_caption = enhanced_caption.strip()
             
             # Clean up the caption
             enhanced_caption = self.clean_caption(enhanced_caption)
             
             # Add format-specific elements
-            enhanced_caption = self.add_format_elements(enhanced_caption, template)
+            return self.add_format_elements(enhanced_caption, template)
+
+    def enhance_caption(
+        self,
+        base_caption: str,
+        format_type: str,
+        seed: Optional[int] = None,
+        streamer: Optional[TextStreamer] = None,
+        max_new_tokens: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """Enhance caption based on format type; ``streamer`` receives GPT-2 tokens as they are decoded
+
+        ``max_new_tokens`` overrides the configured token budget and sampling
+        stops at ``deadline`` (a ``time.monotonic()`` value). Raises
+        DeadlineExceeded when GPT-2 sampling no longer fits before it.
+        """
+        try:
+            template = self.format_templates.get(format_type, self.format_templates['casual'])
+            
+            enhancer = self.enhancer_for(format_type)
+            if enhancer is not None:
+                with stage_timer(enhancer.name):
+                    return self.add_format_elements(enhancer.enhance(base_caption, format_type, template, seed), template)
+            
+            # Tokenize the prompt; the format's prefix is already prefilled in the cached past
+            inputs, past_key_values = self.encode_prompt(base_caption, format_type)
+            
+            stopper = self.sentence_stopper(inputs.shape[1])
+            outputs = self.sample_gpt2(
+                seed,
+                inputs,
+                torch.ones_like(inputs),
+                past_key_values=past_key_values,
+                streamer=streamer,
+                max_new_tokens=max_new_tokens,
+                deadline=deadline,
+                stopper=stopper
+            )
             
-            return enhanced_caption
+            generated_text = self.gpt2_tokenizer.decode(outputs[0], skip_special_tokens=True)
+            return self.finish_caption(generated_text, template, stopped_early=stopper is not None and stopper.stopped(0))
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Error enhancing caption: {e}")
+            record_fallback(self.metrics_format(format_type), "gpt2")
             return self.get_fallback_caption(base_caption, format_type)
 
+    def enhancer_for(self, format_type: str) -> Optional[CaptionEnhancer]:
+        """The enhancer serving ``format_type``, or None when it is sampled with GPT-2"""
+        return self.enhancers.get(format_type)
+
+    def enhance_captions(self, base_caption: str, format_types: List[str], seed: Optional[int] = None) -> Dict[str, str]:
+        """Enhance one base caption into several formats; the GPT-2 formats share a single batched call"""
+        if any(self.enhancer_for(f) is not None for f in format_types):
+            captions = {f: self.enhance_caption(base_caption, f, seed) for f in format_types if self.enhancer_for(f) is not None}
+            sampled = [f for f in format_types if f not in captions]
+            if sampled:
+                captions.update(self.enhance_captions(base_caption, sampled, seed))
+            return {f: captions[f] for f in format_types}
+        
+        try:
+            templates = [self.format_templates.get(f, self.format_templates['casual']) for f in format_types]
+            prompts = [self.build_prompt(base_caption, template) for template in templates]
+            
+            # Prompts differ in length; the tokenizer left-pads so generation continues from real tokens
+            inputs = self.gpt2_tokenizer(prompts, return_tensors="pt", padding=True, max_length=100, truncation=True)
+            stopper = self.sentence_stopper(inputs['input_ids'].shape[1])
+            outputs = self.sample_gpt2(seed, inputs['input_ids'], inputs['attention_mask'], stopper=stopper)
+            
+            generated_texts = self.gpt2_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            return {
+                format_type: self.finish_caption(text, template, stopped_early=stopper is not None and stopper.stopped(row))
+                for row, (format_type, text, template) in enumerate(zip(format_types, generated_texts, templates))
+            }
+            
+        except Exception as e:
+            print(f"Error enhancing captions: {e}")
+            for f in format_types:
+                record_fallback(self.metrics_format(f), "gpt2")
+            return {f: self.get_fallback_caption(base_caption, f) for f in format_types}
+
+    def sample_gpt2(
+        self,
+        seed: Optional[int],
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        past_key_values=None,
+        streamer: Optional[TextStreamer] = None,
+        max_new_tokens: Optional[int] = None,
+        deadline: Optional[float] = None,
+        stopper: Optional[SentenceStoppingCriteria] = None,
+    ) -> torch.Tensor:
+        """Sample a GPT-2 continuation through the engine, reproducibly when a seed is given
+
+        Sampling ends at the caption's end through ``stopper`` (one is made
+        when not given and ``stop_at_caption_end`` is on).
+
+        Engines that sample from a per-call generator need no locking. For the
+        others the global RNG is shared: unseeded runs hold the seed lock
+        shared and run concurrently, a seeded run reseeds it and holds the lock
+        exclusively. The time left before ``deadline`` is measured once
+        sampling may start, so waiting for the lock counts against it;
+        DeadlineExceeded is raised instead of starting when what is left can't
+        fit the sample.
+        """
+        max_new_tokens = max_new_tokens or self.gpt2_max_new_tokens
+        if stopper is None:
+            stopper = self.sentence_stopper(input_ids.shape[1])
+        stopping_criteria = StoppingCriteriaList([stopper]) if stopper is not None else None
+        
+        def generate(generator: Optional[torch.Generator] = None):
+            max_time = self.time_left(deadline)
+            if max_time is not None and (max_time <= 0 or max_time < self.latency.gpt2_seconds(max_new_tokens)):
+                raise DeadlineExceeded("Too little time left for GPT-2 sampling")
+            
+            start = time.perf_counter()
+            with stage_timer("gpt2"):
+                outputs = self.engine.generate_text(
+                    input_ids,
+                    attention_mask,
+                    max_new_tokens=max_new_tokens,
+                    temperature=self.gpt2_temperature,
+                    pad_token_id=self.gpt2_tokenizer.eos_token_id,
+                    past_key_values=past_key_values,
+                    streamer=streamer,
+                    max_time=max_time,
+                    stopping_criteria=stopping_criteria,
+                    generator=generator
+                )
+            elapsed = time.perf_counter() - start
+            # Finished rows are padded with eos, so only count real tokens
+            new_tokens = int((outputs[:, input_ids.shape[1]:] != self.gpt2_tokenizer.eos_token_id).sum())
+            record_tokens(new_tokens, elapsed)
+            self.latency.observe_gpt2(new_tokens, elapsed)
+            return outputs
+        
+        if self.engine.accepts_generator:
+            return generate(torch.Generator().manual_seed(seed) if seed is not None else None)
+        
+        # The torch RNG is process-global and generate() takes no per-call generator; an unseeded
+        # run must not draw from it between a seeded run's manual_seed() and its sampling
+        if seed is None:
+            with self._seed_lock.shared():
+                return generate()
+        with self._seed_lock.exclusive():
+            torch.manual_seed(seed)
+            return generate()
+
+    def sentence_stopper(self, prompt_length: int) -> Optional[SentenceStoppingCriteria]:
+        """Stopping criterion ending sampling at the caption's end, or None when stop_at_caption_end is off"""
+        if not self.stop_at_caption_end:
+            return None
+        return SentenceStoppingCriteria(self.gpt2_tokenizer, prompt_length, self.min_caption_chars)
+
     def clean_caption(self, caption: str) -> str:
         """Clean and format the generated caption"""
         # Remove incomplete sentences
@@ -160,6 +576,10 @@ class CaptionGenerator:
         else:
             return f"{caption} {emoji_map['casual'][0]}"
 
+    def metrics_format(self, format_type: str) -> str:
+        """Format name as a metrics label; unknown (user-supplied) names are grouped to bound cardinality"""
+        return format_type if format_type in self.format_templates else "other"
+
     def get_fallback_caption(self, base_caption: str, format_type: str) -> str:
         """Provide fallback captions when AI generation fails"""
         fallbacks = {
@@ -173,17 +593,257 @@ class CaptionGenerator:
         
         return fallbacks.get(format_type, fallbacks['casual'])
 
-    def generate_caption(self, image: Image.Image, format_type: str = 'casual') -> str:
-        """Main method to generate caption"""
+    def generate_caption(
+        self,
+        image: Image.Image,
+        format_type: str = 'casual',
+        image_key: Optional[str] = None,
+        seed: Optional[int] = None,
+        direct: bool = False,
+    ) -> str:
+        """Main method to generate caption
+
+        ``image_key`` (a digest of the uploaded bytes) enables the base caption
+        cache; ``seed`` makes enhancement reproducible and therefore cacheable.
+        ``direct`` skips the caches and the BLIP batcher so all model work
+        happens on the calling thread (used for profiled requests).
+        """
+        return self.generate_caption_within(image, format_type, None, image_key, seed, direct)[0]
+
+    def time_left(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def gpt2_estimate(self, format_type: str, max_new_tokens: int) -> float:
+        """Expected GPT-2 seconds for ``format_type`` (none for formats served by another enhancer)"""
+        if self.enhancer_for(format_type) is not None:
+            return 0.0
+        return self.latency.gpt2_seconds(max_new_tokens)
+
+    def choose_quality_tier(self, time_left: Optional[float], format_type: str = 'casual') -> str:
+        """Most expensive tier whose estimated BLIP + GPT-2 latency fits in ``time_left`` seconds"""
+        if time_left is None:
+            return 'full'
+        if time_left <= 0:
+            return 'fallback'
+        for tier in ('full', 'reduced'):
+            settings = self.quality_tiers[tier]
+            estimate = self.latency.blip_seconds(settings['num_beams']) + self.gpt2_estimate(format_type, settings['max_new_tokens'])
+            if estimate <= time_left:
+                return tier
+        return 'base_only'
+
+    def generate_caption_within(
+        self,
+        image: Image.Image,
+        format_type: str = 'casual',
+        deadline: Optional[float] = None,
+        image_key: Optional[str] = None,
+        seed: Optional[int] = None,
+        direct: bool = False,
+    ) -> Tuple[str, str]:
+        """Generate a caption with decoding effort scaled to fit ``deadline`` (a ``time.monotonic()`` value)
+
+        Returns the caption and the quality tier served: ``full`` (configured
+        beams and token budget), ``reduced`` (greedy BLIP, shorter GPT-2
+        output), ``base_only`` (the format's fallback caption around the BLIP
+        caption, when GPT-2 would not fit or overran the deadline) or
+        ``fallback`` (no usable model output). Without a deadline the full
+        tier is always attempted.
+        """
         try:
-            # Generate base caption from image
-            base_caption = self.generate_base_caption(image)
+            tier = self.choose_quality_tier(self.time_left(deadline), format_type)
+            if tier == 'fallback':
+                record_fallback(self.metrics_format(format_type), "deadline")
+                return self.get_fallback_caption("A beautiful image", format_type), tier
             
-            # Enhance caption based on format
-            enhanced_caption = self.enhance_caption(base_caption, format_type)
+            # Generate base caption from image; only the full tier shares batches and cache entries
+            settings = self.quality_tiers.get(tier, self.quality_tiers['reduced'])
+            if tier == 'full' and not direct:
+                base_caption = self.cached_base_caption(image, image_key, timeout=self.time_left(deadline))
+            else:
+                base_caption = self.generate_base_captions(
+                    [image], num_beams=settings['num_beams'], max_time=self.time_left(deadline)
+                )[0]
+            if base_caption == self.FALLBACK_BASE_CAPTION:
+                # BLIP cut off at the deadline also ends here, since its partial text isn't a caption
+                time_left = self.time_left(deadline)
+                if time_left is not None and time_left <= 0:
+                    record_fallback(self.metrics_format(format_type), "deadline")
+                return self.get_fallback_caption(base_caption, format_type), 'fallback'
             
-            return enhanced_caption
+            # Skip enhancement when what is left of the budget can't fit it
+            time_left = self.time_left(deadline)
+            fallback_caption = self.get_fallback_caption(base_caption, format_type)
+            out_of_time = time_left is not None and (
+                time_left <= 0 or time_left < self.gpt2_estimate(format_type, settings['max_new_tokens'])
+            )
+            if tier == 'base_only' or out_of_time:
+                record_fallback(self.metrics_format(format_type), "deadline")
+                return fallback_caption, 'base_only'
+            
+            # Enhance caption based on format; sampling that no longer fits once it may start is skipped
+            try:
+                if tier == 'full' and not direct:
+                    enhanced_caption = self.cached_enhance_caption(base_caption, format_type, seed, deadline=deadline)
+                else:
+                    enhanced_caption = self.enhance_caption(
+                        base_caption, format_type, seed, max_new_tokens=settings['max_new_tokens'], deadline=deadline
+                    )
+            except DeadlineExceeded:
+                record_fallback(self.metrics_format(format_type), "deadline")
+                return fallback_caption, 'base_only'
+            
+            # Generation cut short at the deadline is answered like a skipped GPT-2 stage
+            time_left = self.time_left(deadline)
+            if time_left is not None and time_left <= 0:
+                record_fallback(self.metrics_format(format_type), "deadline")
+                return fallback_caption, 'base_only'
+            if enhanced_caption == fallback_caption:
+                return fallback_caption, 'base_only'
+            return enhanced_caption, tier
+            
+        except Exception as e:
+            print(f"Error in caption generation: {e}")
+            record_fallback(self.metrics_format(format_type), "pipeline")
+            return self.get_fallback_caption("A beautiful image", format_type), 'fallback'
+
+    def stream_caption(
+        self,
+        image: Image.Image,
+        format_type: str,
+        on_event: Callable[[str, str], None],
+        image_key: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> str:
+        """Generate a caption while reporting progress through ``on_event(kind, text)``
+
+        Emits ``("base", base_caption)`` as soon as BLIP is done and
+        ``("token", text)`` for each chunk of GPT-2 output as it is decoded,
+        then returns the final cleaned and formatted caption. A cache hit skips
+        straight to the result without token events.
+        """
+        try:
+            base_caption = self.cached_base_caption(image, image_key)
+            on_event("base", base_caption)
+            
+            streamer = CallbackStreamer(self.gpt2_tokenizer, lambda text: on_event("token", text))
+            return self.cached_enhance_caption(base_caption, format_type, seed, streamer)
+            
+        except Exception as e:
+            print(f"Error in caption generation: {e}")
+            record_fallback(self.metrics_format(format_type), "pipeline")
+            return self.get_fallback_caption("A beautiful image", format_type)
+
+    def generate_all_captions(
+        self,
+        image: Image.Image,
+        format_types: Optional[List[str]] = None,
+        image_key: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> Dict[str, str]:
+        """Caption an image in several formats from one BLIP pass and one batched GPT-2 call"""
+        if format_types is None:
+            format_types = list(self.format_templates.keys())
+        
+        try:
+            base_caption = self.cached_base_caption(image, image_key)
+            return self.cached_enhance_captions(base_caption, format_types, seed)
             
         except Exception as e:
             print(f"Error in caption generation: {e}")
-            return self.get_fallback_caption("A beautiful image", format_type)
\ No newline at end of file
+            for f in format_types:
+                record_fallback(self.metrics_format(f), "pipeline")
+            return {f: self.get_fallback_caption("A beautiful image", f) for f in format_types}
+
+    def cached_base_caption(self, image: Image.Image, image_key: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """generate_base_caption behind the base caption cache and the near-duplicate index"""
+        key = None
+        if self.base_cache is not None and image_key is not None:
+            key = make_key(image_key, self.BLIP_MODEL_NAME, sorted(self.blip_generate_kwargs.items()), self.engine_name, self.precision)
+            caption = self.base_cache.get(key)
+            if caption is not None:
+                return caption
+        
+        # A recropped or recompressed copy of an earlier image reuses its caption
+        image_hash = dhash(image) if self.near_duplicates is not None else None
+        # Flat images all hash alike, so they are neither matched nor indexed
+        if image_hash is not None and not distinctive(image_hash):
+            image_hash = None
+        if image_hash is not None:
+            caption = self.near_duplicates.lookup(image_hash, self.near_duplicate_scope())
+            record_near_duplicate_lookup(caption is not None)
+            if caption is not None:
+                if key is not None:
+                    self.base_cache.set(key, caption)
+                return caption
+        
+        caption = self.generate_base_caption(image, timeout)
+        if caption != self.FALLBACK_BASE_CAPTION:
+            if key is not None:
+                self.base_cache.set(key, caption)
+            if image_hash is not None:
+                self.near_duplicates.add(image_hash, caption, self.near_duplicate_scope())
+        return caption
+
+    def near_duplicate_scope(self) -> str:
+        """Near-duplicate index partition for the current BLIP model, settings and engine"""
+        return make_key(self.BLIP_MODEL_NAME, sorted(self.blip_generate_kwargs.items()), self.engine_name, self.precision)
+
+    def enhanced_cache_key(self, base_caption: str, format_type: str, seed: int, batch: Optional[List[str]] = None) -> str:
+        """Enhanced cache key; ``batch`` is the list of formats sampled together by enhance_captions
+
+        A seed gives different text for a format sampled alone (prefix-cached
+        prompt) than inside a padded batch, and the batch's makeup changes the
+        RNG draws, so each path and batch gets its own entries.
+        """
+        return make_key(
+            base_caption, format_type, seed,
+            self.GPT2_MODEL_NAME, self.gpt2_max_new_tokens, self.gpt2_temperature, self.engine_name, self.precision,
+            self.stop_at_caption_end, self.min_caption_chars,
+            "single" if batch is None else ("batch", tuple(batch))
+        )
+
+    def cached_enhance_caption(
+        self,
+        base_caption: str,
+        format_type: str,
+        seed: Optional[int] = None,
+        streamer: Optional[TextStreamer] = None,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """enhance_caption behind the enhanced caption cache (seeded GPT-2 requests only)"""
+        if self.enhanced_cache is None or seed is None or self.enhancer_for(format_type) is not None:
+            return self.enhance_caption(base_caption, format_type, seed, streamer, deadline=deadline)
+        
+        key = self.enhanced_cache_key(base_caption, format_type, seed)
+        caption = self.enhanced_cache.get(key)
+        if caption is None:
+            caption = self.enhance_caption(base_caption, format_type, seed, streamer, deadline=deadline)
+            # A caption cut short at the deadline is not what this seed normally produces
+            cut_short = deadline is not None and time.monotonic() >= deadline
+            if not cut_short and caption != self.get_fallback_caption(base_caption, format_type):
+                self.enhanced_cache.set(key, caption)
+        return caption
+
+    def cached_enhance_captions(self, base_caption: str, format_types: List[str], seed: Optional[int] = None) -> Dict[str, str]:
+        """enhance_captions behind the enhanced caption cache; only misses are generated"""
+        if self.enhanced_cache is None or seed is None:
+            return self.enhance_captions(base_caption, format_types, seed)
+        
+        # Template-style enhancers are cheaper than a cache lookup
+        sampled = [format_type for format_type in format_types if self.enhancer_for(format_type) is None]
+        keys = {format_type: self.enhanced_cache_key(base_caption, format_type, seed, batch=sampled) for format_type in sampled}
+        captions = {format_type: self.enhanced_cache.get(key) for format_type, key in keys.items()}
+        
+        # Any miss resamples the whole batch, so every stored caption comes from the batch its key names
+        if any(caption is None for caption in captions.values()):
+            captions = self.enhance_captions(base_caption, format_types, seed)
+            for format_type, key in keys.items():
+                if captions[format_type] != self.get_fallback_caption(base_caption, format_type):
+                    self.enhanced_cache.set(key, captions[format_type])
+        
+        templated = [format_type for format_type in format_types if format_type not in captions]
+        if templated:
+            captions.update(self.enhance_captions(base_caption, templated, seed))
+        
+        return {format_type: captions[format_type] for format_type in format_types}
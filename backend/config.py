@@ -0,0 +1,108 @@
+"""
+Runtime configuration for the caption backend, read from the environment / .env
+"""
+
+import os
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _get_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _get_optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else None
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _get_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _get_mapping(name: str, default: str) -> Dict[str, str]:
+    """Parse ``key=value,key=value`` into a dict"""
+    mapping = {}
+    for pair in os.getenv(name, default).split(","):
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+# BLIP micro-batching: requests arriving within the wait window are captioned together
+BLIP_MAX_BATCH_SIZE = _get_int("BLIP_MAX_BATCH_SIZE", 8)
+BLIP_BATCH_WAIT_MS = _get_float("BLIP_BATCH_WAIT_MS", 10.0)
+
+# Inference worker pool: requests beyond workers + queue are rejected with 503
+INFERENCE_WORKERS = _get_int("INFERENCE_WORKERS", 4)
+INFERENCE_MAX_QUEUE = _get_int("INFERENCE_MAX_QUEUE", 32)
+
+# Caption cache: in-memory LRU backed by SQLite (empty path = memory only)
+CAPTION_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", "./cache/captions.sqlite3")
+CAPTION_CACHE_MEMORY_ENTRIES = _get_int("CAPTION_CACHE_MEMORY_ENTRIES", 1024)
+CAPTION_CACHE_DISK_ENTRIES = _get_int("CAPTION_CACHE_DISK_ENTRIES", 100000)
+
+# Upload limits, enforced while reading and from the image header before decoding
+MAX_UPLOAD_BYTES = _get_int("MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_ARCHIVE_BYTES = _get_int("MAX_ARCHIVE_BYTES", 500 * 1024 * 1024)
+# Image bytes one bulk request may carry: uploaded files plus the inflated size of archive entries
+BULK_MAX_TOTAL_BYTES = _get_int("BULK_MAX_TOTAL_BYTES", 512 * 1024 * 1024)
+MAX_IMAGE_PIXELS = _get_int("MAX_IMAGE_PIXELS", 40_000_000)
+
+# Near-duplicate index: reuse the base caption of an image within this dHash Hamming distance (of 64 bits)
+NEAR_DUPLICATE_INDEX = _get_bool("NEAR_DUPLICATE_INDEX", True)
+NEAR_DUPLICATE_MAX_DISTANCE = _get_int("NEAR_DUPLICATE_MAX_DISTANCE", 4)
+NEAR_DUPLICATE_MAX_ENTRIES = _get_int("NEAR_DUPLICATE_MAX_ENTRIES", 100000)
+
+# Default sampling seed; when set, GPT-2 output is reproducible and cached
+CAPTION_SEED = _get_optional_int("CAPTION_SEED")
+
+# Bulk captioning: images accepted per request and how many of them run at once
+BULK_MAX_IMAGES = _get_int("BULK_MAX_IMAGES", 500)
+BULK_MAX_IN_FLIGHT = _get_int("BULK_MAX_IN_FLIGHT", INFERENCE_WORKERS)
+
+# Asynchronous jobs (POST /jobs): SQLite store, background workers per process, result TTL
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "./cache/jobs.sqlite3")
+JOB_WORKERS = _get_int("JOB_WORKERS", 2)
+JOB_MAX_QUEUED = _get_int("JOB_MAX_QUEUED", 1000)
+JOB_RESULT_TTL_SECONDS = _get_int("JOB_RESULT_TTL_SECONDS", 86400)
+JOB_POLL_INTERVAL_SECONDS = _get_float("JOB_POLL_INTERVAL_SECONDS", 1.0)
+JOB_BATCH_MAX_IDS = _get_int("JOB_BATCH_MAX_IDS", 100)
+
+# Run a synthetic inference after loading, before reporting ready
+MODEL_WARMUP = _get_bool("MODEL_WARMUP", True)
+
+# Inference precision for BLIP and GPT-2: fp32, int8 (dynamic quantization, CPU) or bf16
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+
+# Stop GPT-2 at the first complete sentence, newline or hashtag run after this many characters
+GPT2_STOP_AT_CAPTION_END = _get_bool("GPT2_STOP_AT_CAPTION_END", True)
+GPT2_MIN_CAPTION_CHARS = _get_int("GPT2_MIN_CAPTION_CHARS", 20)
+
+# Caption enhancer per format (gpt2 or template), e.g. formal=template; unlisted formats use GPT-2
+ENHANCER_BY_FORMAT = _get_mapping("ENHANCER_BY_FORMAT", "")
+
+# Inference engine: torch, or onnx to run the graphs exported by backend.onnx_export on ONNX Runtime
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./cache/onnx")
+
+# Default latency budget for /generate-caption in ms (0 = none); decoding effort is scaled to fit it
+DEFAULT_DEADLINE_MS = _get_int("DEFAULT_DEADLINE_MS", 0)
+
+# Pre-fork serving: worker processes and torch intra-op threads per worker (0 = cores / workers)
+PREFORK_WORKERS = _get_int("PREFORK_WORKERS", 2)
+WORKER_THREADS = _get_int("WORKER_THREADS", 0)
+
+# Opt-in per-request profiling (X-Profile header); with a token set the header must match it
+PROFILING_ENABLED = _get_bool("PROFILING_ENABLED", False)
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./cache/profiles")
+PROFILE_MAX_TRACES = _get_int("PROFILE_MAX_TRACES", 20)
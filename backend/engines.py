@@ -0,0 +1,361 @@
+"""
+Inference engines that run the BLIP and GPT-2 models for CaptionGenerator
+
+The generator owns tokenization, prompts and post-processing; an engine only
+turns pixel values into BLIP caption token ids and GPT-2 prompt ids into
+sampled continuations. ``TorchEngine`` wraps the Hugging Face models and their
+``generate()``; ``OnnxEngine`` runs exported graphs on ONNX Runtime's CPU
+execution provider (see ``backend.onnx_export``).
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from transformers import BlipForConditionalGeneration, GPT2LMHeadModel, TextStreamer
+from transformers.generation import (
+    BeamSearchScorer,
+    LogitsProcessorList,
+    StoppingCriteriaList,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+)
+
+from .precision import apply_precision, model_dtype, model_memory_bytes
+
+ENGINES = ("torch", "onnx")
+
+# GPT-2 generate() samples with top-k 50 unless told otherwise; the ONNX path matches it
+GPT2_TOP_K = 50
+
+
+class InferenceEngine:
+    """Model execution backend behind generate_base_caption and enhance_caption"""
+
+    name = "base"
+    # Whether generate_text can sample from a per-call torch.Generator instead of the global RNG
+    accepts_generator = False
+
+    def load_blip(self):
+        raise NotImplementedError
+
+    def load_gpt2(self):
+        raise NotImplementedError
+
+    def generate_base(
+        self, pixel_values: torch.Tensor, max_length: int, num_beams: int, max_time: Optional[float] = None
+    ) -> torch.Tensor:
+        """BLIP caption token ids for a batch of preprocessed images, stopping early after ``max_time`` seconds"""
+        raise NotImplementedError
+
+    def prefill(self, input_ids: torch.Tensor) -> Any:
+        """GPT-2 past key/values for a prompt prefix, reusable by ``generate_text``"""
+        raise NotImplementedError
+
+    def generate_text(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        max_new_tokens: int,
+        temperature: float,
+        pad_token_id: int,
+        past_key_values: Any = None,
+        streamer: Optional[TextStreamer] = None,
+        max_time: Optional[float] = None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+        generator: Optional[torch.Generator] = None,
+    ) -> torch.Tensor:
+        """Sample a GPT-2 continuation, stopping early after ``max_time`` seconds or when ``stopping_criteria`` say so
+
+        Engines with ``accepts_generator`` draw from ``generator`` when one is
+        given. Returns the prompt ids followed by the new tokens.
+        """
+        raise NotImplementedError
+
+    def memory_bytes(self) -> Dict[str, int]:
+        return {}
+
+    def share_memory(self):
+        """Move weights into shared memory ahead of fork(), where supported"""
+
+
+class TorchEngine(InferenceEngine):
+    """PyTorch models driven by Hugging Face ``generate()``"""
+
+    name = "torch"
+
+    def __init__(self, blip_model_name: str, gpt2_model_name: str, device: torch.device, precision: str = "fp32"):
+        self.blip_model_name = blip_model_name
+        self.gpt2_model_name = gpt2_model_name
+        self.device = device
+        self.precision = precision
+        self.blip_model = None
+        self.gpt2_model = None
+
+    def load_blip(self):
+        self.blip_model = BlipForConditionalGeneration.from_pretrained(self.blip_model_name)
+        self.blip_model.to(self.device)
+        self.blip_model = apply_precision(self.blip_model, self.precision, self.device)
+        self.blip_model.eval()
+
+    def load_gpt2(self):
+        self.gpt2_model = GPT2LMHeadModel.from_pretrained(self.gpt2_model_name)
+        self.gpt2_model.to(self.device)
+        self.gpt2_model = apply_precision(self.gpt2_model, self.precision, self.device)
+        self.gpt2_model.eval()
+
+    def generate_base(
+        self, pixel_values: torch.Tensor, max_length: int, num_beams: int, max_time: Optional[float] = None
+    ) -> torch.Tensor:
+        pixel_values = pixel_values.to(self.device, model_dtype(self.blip_model))
+        with torch.no_grad():
+            return self.blip_model.generate(pixel_values=pixel_values, max_length=max_length, num_beams=num_beams, max_time=max_time)
+
+    def prefill(self, input_ids: torch.Tensor) -> Any:
+        with torch.no_grad():
+            return self.gpt2_model(input_ids.to(self.device), use_cache=True).past_key_values
+
+    def generate_text(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        max_new_tokens: int,
+        temperature: float,
+        pad_token_id: int,
+        past_key_values: Any = None,
+        streamer: Optional[TextStreamer] = None,
+        max_time: Optional[float] = None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+        generator: Optional[torch.Generator] = None,
+    ) -> torch.Tensor:
+        # generate() only samples from the global RNG, hence accepts_generator = False
+        with torch.no_grad():
+            return self.gpt2_model.generate(
+                input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+                past_key_values=past_key_values,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                do_sample=True,
+                pad_token_id=pad_token_id,
+                streamer=streamer,
+                max_time=max_time,
+                stopping_criteria=stopping_criteria
+            )
+
+    def memory_bytes(self) -> Dict[str, int]:
+        return {
+            'blip': model_memory_bytes(self.blip_model),
+            'gpt2': model_memory_bytes(self.gpt2_model)
+        }
+
+    def share_memory(self):
+        self.blip_model.share_memory()
+        self.gpt2_model.share_memory()
+
+
+class OnnxEngine(InferenceEngine):
+    """Exported BLIP vision encoder / text decoder and GPT-2 (with past key/values) on ONNX Runtime
+
+    Decoding mirrors what ``generate()`` does for the PyTorch models: BLIP uses
+    Hugging Face's ``BeamSearchScorer`` over decoder logits, GPT-2 samples with
+    the same temperature and top-k warpers. Sampling draws from the per-call
+    generator when given (seeded like the global CPU RNG, it yields the same
+    tokens), so seeded requests need no process-wide lock.
+    """
+
+    name = "onnx"
+    accepts_generator = True
+
+    BLIP_VISION_FILE = "blip_vision.onnx"
+    BLIP_DECODER_FILE = "blip_text_decoder.onnx"
+    GPT2_FILE = "gpt2_with_past.onnx"
+
+    def __init__(self, artifact_dir: str, blip_config, gpt2_eos_token_id: int, intra_op_threads: int = 0):
+        self.artifact_dir = artifact_dir
+        self.intra_op_threads = intra_op_threads
+        self.bos_token_id = blip_config.text_config.bos_token_id
+        self.sep_token_id = blip_config.text_config.sep_token_id
+        self.blip_pad_token_id = blip_config.text_config.pad_token_id
+        self.gpt2_eos_token_id = gpt2_eos_token_id
+
+        self.blip_vision = None
+        self.blip_decoder = None
+        self.gpt2 = None
+        self.past_shapes: List[tuple] = []
+
+    def _session(self, filename: str):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("The onnx engine needs onnxruntime (pip install onnxruntime)") from e
+
+        path = os.path.join(self.artifact_dir, filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, export it first: python -m backend.onnx_export --output {self.artifact_dir}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def load_blip(self):
+        self.blip_vision = self._session(self.BLIP_VISION_FILE)
+        self.blip_decoder = self._session(self.BLIP_DECODER_FILE)
+
+    def load_gpt2(self):
+        self.gpt2 = self._session(self.GPT2_FILE)
+        # (heads, head_dim) of every past.* input, used to build an empty cache
+        self.past_shapes = [
+            (item.name, item.shape[1], item.shape[3])
+            for item in self.gpt2.get_inputs() if item.name.startswith("past.")
+        ]
+
+    def _decoder_logits(self, input_ids: torch.Tensor, image_embeds: np.ndarray) -> torch.Tensor:
+        logits = self.blip_decoder.run(None, {
+            "input_ids": input_ids.numpy(),
+            "encoder_hidden_states": image_embeds,
+        })[0]
+        return torch.from_numpy(logits)
+
+    def generate_base(
+        self, pixel_values: torch.Tensor, max_length: int, num_beams: int, max_time: Optional[float] = None
+    ) -> torch.Tensor:
+        stop_at = time.monotonic() + max_time if max_time is not None else None
+        pixel_values = pixel_values.to(torch.float32).cpu().numpy()
+        image_embeds = self.blip_vision.run(None, {"pixel_values": pixel_values})[0]
+        batch_size = image_embeds.shape[0]
+        input_ids = torch.full((batch_size, 1), self.bos_token_id, dtype=torch.long)
+
+        if num_beams <= 1:
+            return self._greedy_base(input_ids, image_embeds, max_length, stop_at)
+
+        # Same bookkeeping as GenerationMixin.beam_search
+        image_embeds = np.repeat(image_embeds, num_beams, axis=0)
+        input_ids = input_ids.repeat_interleave(num_beams, dim=0)
+        scorer = BeamSearchScorer(batch_size=batch_size, num_beams=num_beams, device=torch.device("cpu"), max_length=max_length)
+        beam_scores = torch.zeros((batch_size, num_beams), dtype=torch.float)
+        beam_scores[:, 1:] = -1e9
+        beam_scores = beam_scores.view(-1)
+
+        while True:
+            scores = torch.log_softmax(self._decoder_logits(input_ids, image_embeds), dim=-1)
+            scores = scores + beam_scores[:, None]
+            vocab_size = scores.shape[-1]
+            scores = scores.view(batch_size, num_beams * vocab_size)
+
+            next_scores, next_tokens = torch.topk(scores, 2 * num_beams, dim=1, largest=True, sorted=True)
+            next_indices = torch.div(next_tokens, vocab_size, rounding_mode="floor")
+            next_tokens = next_tokens % vocab_size
+
+            beam_outputs = scorer.process(
+                input_ids, next_scores, next_tokens, next_indices,
+                pad_token_id=self.blip_pad_token_id, eos_token_id=self.sep_token_id
+            )
+            beam_scores = beam_outputs["next_beam_scores"]
+            beam_idx = beam_outputs["next_beam_indices"]
+            input_ids = torch.cat([input_ids[beam_idx, :], beam_outputs["next_beam_tokens"].unsqueeze(-1)], dim=-1)
+
+            if scorer.is_done or input_ids.shape[-1] >= max_length:
+                break
+            if stop_at is not None and time.monotonic() >= stop_at:
+                break
+
+        return scorer.finalize(
+            input_ids, beam_scores, next_tokens, next_indices,
+            pad_token_id=self.blip_pad_token_id, eos_token_id=self.sep_token_id, max_length=max_length
+        )["sequences"]
+
+    def _greedy_base(self, input_ids: torch.Tensor, image_embeds: np.ndarray, max_length: int, stop_at: Optional[float]) -> torch.Tensor:
+        unfinished = torch.ones(input_ids.shape[0], dtype=torch.long)
+        while input_ids.shape[-1] < max_length:
+            next_tokens = self._decoder_logits(input_ids, image_embeds).argmax(dim=-1)
+            next_tokens = next_tokens * unfinished + self.blip_pad_token_id * (1 - unfinished)
+            input_ids = torch.cat([input_ids, next_tokens[:, None]], dim=-1)
+            unfinished = unfinished * next_tokens.ne(self.sep_token_id).long()
+            if unfinished.max() == 0 or (stop_at is not None and time.monotonic() >= stop_at):
+                break
+        return input_ids
+
+    def _empty_past(self, batch_size: int) -> Dict[str, np.ndarray]:
+        return {
+            name: np.zeros((batch_size, heads, 0, head_dim), dtype=np.float32)
+            for name, heads, head_dim in self.past_shapes
+        }
+
+    def _run_gpt2(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, past: Dict[str, np.ndarray]):
+        """One GPT-2 step; returns last-position logits and the updated past"""
+        position_ids = attention_mask.long().cumsum(-1) - 1
+        position_ids.masked_fill_(attention_mask == 0, 1)
+        position_ids = position_ids[:, -input_ids.shape[1]:]
+
+        outputs = self.gpt2.run(None, {
+            "input_ids": input_ids.numpy(),
+            "attention_mask": attention_mask.numpy(),
+            "position_ids": position_ids.numpy(),
+            **past,
+        })
+        presents = {name: value for (name, _, _), value in zip(self.past_shapes, outputs[1:])}
+        return torch.from_numpy(outputs[0][:, -1, :]), presents
+
+    def prefill(self, input_ids: torch.Tensor) -> Any:
+        _, past = self._run_gpt2(input_ids.cpu(), torch.ones_like(input_ids).cpu(), self._empty_past(input_ids.shape[0]))
+        return past
+
+    def generate_text(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        max_new_tokens: int,
+        temperature: float,
+        pad_token_id: int,
+        past_key_values: Any = None,
+        streamer: Optional[TextStreamer] = None,
+        max_time: Optional[float] = None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+        generator: Optional[torch.Generator] = None,
+    ) -> torch.Tensor:
+        stop_at = time.monotonic() + max_time if max_time is not None else None
+        input_ids = input_ids.cpu()
+        attention_mask = attention_mask.cpu()
+        warpers = LogitsProcessorList([TemperatureLogitsWarper(temperature), TopKLogitsWarper(GPT2_TOP_K)])
+
+        past = past_key_values if past_key_values is not None else self._empty_past(input_ids.shape[0])
+        past_length = next(iter(past.values())).shape[2] if past else 0
+        step_ids = input_ids[:, past_length:]
+
+        if streamer is not None:
+            streamer.put(input_ids)
+
+        sequences = input_ids
+        unfinished = torch.ones(input_ids.shape[0], dtype=torch.long)
+        for _ in range(max_new_tokens):
+            logits, past = self._run_gpt2(step_ids, attention_mask, past)
+            probs = torch.softmax(warpers(sequences, logits), dim=-1)
+            next_tokens = torch.multinomial(probs, num_samples=1, generator=generator).squeeze(1)
+            next_tokens = next_tokens * unfinished + pad_token_id * (1 - unfinished)
+
+            sequences = torch.cat([sequences, next_tokens[:, None]], dim=-1)
+            attention_mask = torch.cat([attention_mask, torch.ones_like(next_tokens)[:, None]], dim=-1)
+            if streamer is not None:
+                streamer.put(next_tokens)
+
+            unfinished = unfinished * next_tokens.ne(self.gpt2_eos_token_id).long()
+            if unfinished.max() == 0 or (stop_at is not None and time.monotonic() >= stop_at):
+                break
+            if stopping_criteria is not None and stopping_criteria(sequences, logits):
+                break
+            step_ids = next_tokens[:, None]
+
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+    def memory_bytes(self) -> Dict[str, int]:
+        sizes = {}
+        for name, files in (('blip', (self.BLIP_VISION_FILE, self.BLIP_DECODER_FILE)), ('gpt2', (self.GPT2_FILE,))):
+            sizes[name] = sum(os.path.getsize(os.path.join(self.artifact_dir, f)) for f in files)
+        return sizes
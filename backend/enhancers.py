@@ -0,0 +1,146 @@
+"""
+Caption enhancers that can stand in for GPT-2 on a per-format basis
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional
+
+# Enhancer names accepted in ENHANCER_BY_FORMAT; "gpt2" is CaptionGenerator's built-in sampling path
+GPT2_ENHANCER = "gpt2"
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+    a an the and or of on in at to with without for from by near next into onto over under
+    is are was were be being been it its this that there their his her some two three
+    up down out off front top side back while other each very
+    sitting standing laying lying holding looking wearing posing walking
+    image picture photo close view
+""".split())
+
+# Words BLIP's captioning head is known to hallucinate
+BLIP_ARTIFACTS = frozenset(["arafed", "araffe", "arafe"])
+
+# Openings that describe the photo rather than its content
+DESCRIPTION_PREFIX = re.compile(r"^(there (is|are) |(a |an )?(close up |black and white )?(photo|picture|image) of )", re.IGNORECASE)
+
+# Leading articles, repeated as BLIP sometimes does ("a a a dog"); templates supply their own
+LEADING_ARTICLES = re.compile(r"^((a|an|the)\s+)+", re.IGNORECASE)
+
+
+class CaptionEnhancer:
+    """Turns a BLIP base caption into the text of a styled caption
+
+    The generator adds the format's emojis and hashtags afterwards, exactly
+    as it does for GPT-2 output.
+    """
+
+    name = "base"
+
+    def enhance(self, base_caption: str, format_type: str, template: Dict, seed: Optional[int] = None) -> str:
+        raise NotImplementedError
+
+
+class TemplateEnhancer(CaptionEnhancer):
+    """Deterministic, rule-based captions built from keywords of the base caption
+
+    A sentence template is picked per format (stable for a given caption and
+    seed) and filled with the cleaned description and its main keywords. A
+    caption with no content words left (e.g. "a a a") gets the format's
+    subject-free line instead of a template with an empty subject.
+    """
+
+    name = "template"
+
+    TEMPLATES = {
+        'casual': [
+            "Just the {description}, nothing more to say",
+            "Caught this one today: the {description}",
+            "Currently loving {keyword_phrase}",
+        ],
+        'formal': [
+            "Pleased to share this image of the {description}.",
+            "A moment worth sharing: the {description}.",
+            "Presenting the {description}.",
+        ],
+        'funny': [
+            "Nobody: ... Me: the {description}",
+            "Plot twist: the {description}",
+            "When {keyword_phrase} is the whole personality",
+        ],
+        'trendy': [
+            "{Keyword} season is officially here",
+            "Serving {keyword_phrase} energy",
+            "POV: the {description}",
+        ],
+        'professional': [
+            "Highlighting {keyword_phrase}: the {description}.",
+            "Today's focus: the {description}.",
+            "Proud to showcase the {description}.",
+        ],
+        'inspirational': [
+            "Find beauty in the simple things, like the {description}.",
+            "Every day brings something new: the {description}.",
+            "Let {keyword_phrase} remind you to keep going.",
+        ],
+    }
+
+    # Used when the base caption has no content words to build a template around
+    SUBJECTLESS = {
+        'casual': "Just a little moment from today",
+        'formal': "Pleased to share this moment.",
+        'funny': "No caption needed, honestly",
+        'trendy': "Main character energy only",
+        'professional': "Sharing a moment from today.",
+        'inspirational': "Find beauty in the simple things.",
+    }
+
+    def __init__(self, max_keywords: int = 3):
+        self.max_keywords = max_keywords
+
+    def extract_keywords(self, base_caption: str) -> List[str]:
+        """Content words of the caption in order of appearance, without duplicates"""
+        keywords = []
+        for word in WORD_PATTERN.findall(base_caption.lower()):
+            if word in STOPWORDS or word in BLIP_ARTIFACTS or len(word) < 3 or word in keywords:
+                continue
+            keywords.append(word)
+        return keywords[:self.max_keywords]
+
+    def clean_description(self, base_caption: str) -> str:
+        """The base caption as a phrase: artifacts, repeated words and leading articles removed, no trailing punctuation"""
+        words = []
+        for word in base_caption.split():
+            if word.lower() in BLIP_ARTIFACTS or (words and word.lower() == words[-1].lower()):
+                continue
+            words.append(word)
+        description = DESCRIPTION_PREFIX.sub("", " ".join(words))
+        return LEADING_ARTICLES.sub("", description).strip(" .,!?")
+
+    def keyword_phrase(self, keywords: List[str]) -> str:
+        if len(keywords) == 1:
+            return keywords[0]
+        return ", ".join(keywords[:-1]) + " and " + keywords[-1]
+
+    def enhance(self, base_caption: str, format_type: str, template: Dict, seed: Optional[int] = None) -> str:
+        keywords = self.extract_keywords(base_caption)
+        description = self.clean_description(base_caption)
+        # Every keyword comes from the description, so no keywords also covers an empty or stopword-only one
+        if not keywords or not description:
+            return self.SUBJECTLESS.get(format_type, self.SUBJECTLESS['casual'])
+
+        choices = self.TEMPLATES.get(format_type, self.TEMPLATES['casual'])
+        # crc32 rather than hash(): stable across processes, so captions are reproducible
+        index = (zlib.crc32(base_caption.encode("utf-8")) + (seed or 0)) % len(choices)
+        caption = choices[index].format(
+            description=description,
+            keyword_phrase=self.keyword_phrase(keywords),
+            Keyword=keywords[0].capitalize(),
+        )
+        return caption[0].upper() + caption[1:]
+
+
+ENHANCERS = {
+    TemplateEnhancer.name: TemplateEnhancer,
+}
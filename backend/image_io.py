@@ -0,0 +1,151 @@
+"""
+Memory-conscious decoding of uploaded images for captioning
+"""
+
+import io
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# BLIP resizes every image to 384x384, so decoding more pixels than that is wasted
+MODEL_INPUT_SIZE = 384
+
+# EXIF orientation tag value -> transpose that makes the image upright
+EXIF_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+EXIF_ORIENTATION_TAG = 0x0112
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each accepted upload format
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+)
+
+
+class UploadError(Exception):
+    """Raised when an upload is rejected before decoding; ``status_code`` is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if it isn't one we accept"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+async def read_upload(upload, max_bytes: int, sniff: bool = True) -> bytes:
+    """Read an UploadFile in chunks, rejecting it as soon as it passes ``max_bytes``
+
+    With ``sniff`` the first chunk must start with a known image signature,
+    so anything else is turned away without reading the rest.
+    """
+    size = getattr(upload, "size", None)
+    if size is not None and size > max_bytes:
+        raise UploadError(413, f"Upload is larger than {max_bytes} bytes")
+
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if sniff and not chunks and sniff_format(chunk) is None:
+            raise UploadError(415, "Unsupported image format, expected JPEG, PNG, GIF, BMP or WebP")
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadError(413, f"Upload is larger than {max_bytes} bytes")
+        chunks.append(chunk)
+
+    if not chunks:
+        raise UploadError(400, "Upload is empty")
+    return b"".join(chunks)
+
+
+def probe_image(image_data: bytes, max_pixels: int) -> Tuple[str, Tuple[int, int]]:
+    """Format and (width, height) from the image header, without decoding any pixels
+
+    Rejects unknown formats and images whose declared pixel count is over
+    ``max_pixels`` (decompression bombs) with ``UploadError``.
+    """
+    if sniff_format(image_data[:16]) is None:
+        raise UploadError(415, "Unsupported image format, expected JPEG, PNG, GIF, BMP or WebP")
+    try:
+        # Image.open only parses the header; pixel data is read lazily
+        with Image.open(io.BytesIO(image_data)) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadError(413, f"Image has more than {max_pixels} pixels")
+    except Exception:
+        raise UploadError(400, "Upload is not a readable image")
+
+    width, height = size
+    if width * height > max_pixels:
+        raise UploadError(413, f"Image is {width}x{height}, more than {max_pixels} pixels")
+    return image_format, size
+
+
+def downscale(image: Image.Image, target_size: int = MODEL_INPUT_SIZE) -> Image.Image:
+    """Shrink so the shorter side is ``target_size``, never upscaling"""
+    width, height = image.size
+    scale = target_size / min(width, height)
+    if scale >= 1:
+        return image
+
+    if image.mode not in ("RGB", "RGBA", "L"):
+        # Palette and other exotic modes can only be resized with nearest neighbour
+        image = image.convert("RGB")
+
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # reducing_gap lets Pillow do a cheap integer reduce() before the final resample
+    return image.resize(new_size, Image.Resampling.BICUBIC, reducing_gap=3.0)
+
+
+def load_image(image_data: bytes, target_size: int = MODEL_INPUT_SIZE, max_pixels: Optional[int] = None) -> Image.Image:
+    """Decode uploaded bytes into an upright RGB image no larger than the model needs
+
+    JPEGs are decoded straight at a reduced scale via ``draft``, other formats
+    are downscaled right after decoding, animated images contribute their
+    first frame only, and EXIF orientation is applied to the small image.
+    With ``max_pixels`` the header is checked by ``probe_image`` first.
+    """
+    if max_pixels is not None:
+        probe_image(image_data, max_pixels)
+
+    image = Image.open(io.BytesIO(image_data))
+
+    # Animated GIF/WebP/PNG: only the first frame is captioned
+    if getattr(image, "is_animated", False):
+        image.seek(0)
+
+    orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
+    if image.format == "JPEG":
+        # libjpeg decodes at 1/2, 1/4 or 1/8 scale, staying at or above the requested size
+        image.draft("RGB", (target_size, target_size))
+
+    image = downscale(image, target_size)
+
+    transpose = EXIF_ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        image = image.transpose(transpose)
+
+    return image.convert("RGB")
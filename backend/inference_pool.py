@@ -0,0 +1,89 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue has no room for another request"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """Dedicated worker threads for model inference with a bounded backlog
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a free worker; anything beyond that is rejected immediately with
+    ``QueueFullError`` instead of piling up behind the event loop.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+        self._lock = threading.Lock()
+        self._pending = 0  # queued + running
+        self._in_flight = 0
+        self._avg_latency = 1.0  # seconds, exponentially weighted
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending - self._in_flight
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up"""
+        waiting = self.queue_depth + 1
+        return max(1, math.ceil(waiting * self._avg_latency / self.max_workers))
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule ``fn`` on a worker, or raise ``QueueFullError`` when saturated"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise QueueFullError(self.retry_after())
+            self._pending += 1
+
+        def run():
+            with self._lock:
+                self._in_flight += 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._in_flight -= 1
+                    self._pending -= 1
+                    self._avg_latency = 0.8 * self._avg_latency + 0.2 * elapsed
+
+        try:
+            return self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run ``fn`` on a worker and await its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "avg_latency_seconds": round(self._avg_latency, 3),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
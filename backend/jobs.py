@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Caption jobs persisted in SQLite so they survive restarts
+
+    A job row holds the uploaded image until a worker has captioned it, then
+    the result (or error) until ``result_ttl`` seconds after it finished.
+    Several processes may share one database (``run.py prefork``): claiming a
+    job is a conditional UPDATE, so each job runs exactly once.
+    """
+
+    def __init__(self, path: str, result_ttl: float = 86400, max_queued: int = 1000):
+        self.path = path
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """SQLite connection, opened lazily and reopened in forked worker processes"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, formats TEXT NOT NULL, seed INTEGER, "
+                "image_name TEXT, image BLOB, result TEXT, error TEXT, worker_pid INTEGER, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+            self._conn.commit()
+        return self._conn
+
+    def submit(self, image_data: bytes, formats: List[str], seed: Optional[int], image_name: Optional[str]) -> Optional[str]:
+        """Queue a job and return its id, or None when ``max_queued`` jobs are already waiting"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if self.max_queued and queued >= self.max_queued:
+                return None
+            self._db.execute(
+                "INSERT INTO jobs (id, status, formats, seed, image_name, image, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(formats), seed, image_name, sqlite3.Binary(image_data), time.time())
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, bytes, List[str], Optional[int]]]:
+        """Mark the oldest queued job as running here; returns (id, image, formats, seed)"""
+        with self._lock:
+            while True:
+                row = self._db.execute(
+                    "SELECT id, image, formats, seed FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE id = ? AND status = 'queued'",
+                    (os.getpid(), time.time(), row[0])
+                ).rowcount
+                self._db.commit()
+                # Another process got there first: try the next one
+                if claimed:
+                    return row[0], bytes(row[1]), json.loads(row[2]), row[3]
+
+    def finish(self, job_id: str, captions: Optional[Dict[str, str]] = None, error: Optional[str] = None):
+        """Store the result (or error) and drop the image"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, finished_at = ? WHERE id = ?",
+                (
+                    "failed" if error is not None else "succeeded",
+                    json.dumps(captions) if captions is not None else None,
+                    error, time.time(), job_id
+                )
+            )
+            self._db.commit()
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict]:
+        """Public view of the given jobs; unknown or expired ids are left out"""
+        if not job_ids:
+            return {}
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, status, formats, seed, image_name, result, error, created_at, started_at, finished_at "
+                f"FROM jobs WHERE id IN ({placeholders}) AND (finished_at IS NULL OR finished_at >= ?)",
+                (*job_ids, time.time() - self.result_ttl)
+            ).fetchall()
+
+        jobs = {}
+        for job_id, status, formats, seed, image_name, result, error, created_at, started_at, finished_at in rows:
+            jobs[job_id] = {
+                "job_id": job_id,
+                "status": status,
+                "formats": json.loads(formats),
+                "seed": seed,
+                "image_name": image_name,
+                "captions": json.loads(result) if result is not None else None,
+                "error": error,
+                "created_at": created_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+            }
+        return jobs
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.get_many([job_id]).get(job_id)
+
+    def requeue_orphaned(self) -> int:
+        """Put running jobs whose worker process has died back in the queue (call before claiming any)
+
+        Jobs owned by this process's pid count as orphaned too: after a
+        container restart the new server often gets the same pid.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+            orphaned = [
+                job_id for job_id, pid in rows
+                if pid is None or pid == os.getpid() or not pid_alive(pid)
+            ]
+            for job_id in orphaned:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', worker_pid = NULL, started_at = NULL WHERE id = ? AND status = 'running'",
+                    (job_id,)
+                )
+            self._db.commit()
+        return len(orphaned)
+
+    def delete_expired(self) -> int:
+        """Remove finished jobs older than the result TTL"""
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - self.result_ttl,)
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
@@ -0,0 +1,51 @@
+"""
+Running latency estimates used to fit caption generation into a deadline
+"""
+
+import threading
+from typing import Dict, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage is not started because too little of the request's deadline is left"""
+
+
+class LatencyEstimator:
+    """Exponentially weighted BLIP pass latency (per beam count) and GPT-2 time per sampled token
+
+    Stages that have not been observed yet have no estimate and are assumed
+    to fit; ``max_time`` on generation still bounds them.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._blip_seconds: Dict[int, float] = {}
+        self._gpt2_seconds_per_token: Optional[float] = None
+
+    def _update(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return (1 - self.alpha) * current + self.alpha * value
+
+    def observe_blip(self, num_beams: int, seconds: float):
+        with self._lock:
+            self._blip_seconds[num_beams] = self._update(self._blip_seconds.get(num_beams), seconds)
+
+    def observe_gpt2(self, tokens: int, seconds: float):
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._gpt2_seconds_per_token = self._update(self._gpt2_seconds_per_token, seconds / tokens)
+
+    def blip_seconds(self, num_beams: int) -> float:
+        return self._blip_seconds.get(num_beams, 0.0)
+
+    def gpt2_seconds(self, max_new_tokens: int) -> float:
+        return (self._gpt2_seconds_per_token or 0.0) * max_new_tokens
+
+    def stats(self) -> Dict:
+        return {
+            "blip_seconds_by_beams": {beams: round(s, 4) for beams, s in self._blip_seconds.items()},
+            "gpt2_seconds_per_token": round(self._gpt2_seconds_per_token, 5) if self._gpt2_seconds_per_token else None,
+        }
@@ -0,0 +1,95 @@
+"""
+Prometheus metrics for the caption pipeline and API
+
+Process RSS, CPU time and open file descriptors come from prometheus_client's
+default process collector (``process_resident_memory_bytes`` etc.). Metrics
+are per process: under pre-fork serving each worker reports its own.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from torch.profiler import record_function
+
+STAGES = ("decode", "blip", "gpt2", "template", "postprocess")
+
+STAGE_SECONDS = Histogram(
+    "caption_stage_seconds",
+    "Time spent in each caption pipeline stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+CAPTION_REQUESTS = Counter(
+    "caption_requests_total",
+    "Captions requested, by format and outcome (success, error, busy, not_ready, rejected); format \"all\" counts failed /generate-all-captions requests",
+    ["format", "outcome"],
+)
+FALLBACK_CAPTIONS = Counter(
+    "caption_fallbacks_total",
+    "Captions served from a fallback instead of model output, by format and failing stage",
+    ["format", "stage"],
+)
+QUALITY_TIERS = Counter("caption_quality_tier_total", "Captions served per quality tier (full, reduced, base_only, fallback)", ["tier"])
+NEAR_DUPLICATE_LOOKUPS = Counter(
+    "caption_near_duplicate_lookups_total",
+    "Perceptual-hash lookups for a reusable base caption, by result (hit, miss)",
+    ["result"],
+)
+BASE_FALLBACKS = Counter("blip_fallback_captions_total", "Images given the fallback base caption because BLIP failed")
+GPT2_TOKENS = Counter("gpt2_generated_tokens_total", "Tokens sampled by GPT-2")
+GPT2_TOKENS_PER_SECOND = Gauge("gpt2_tokens_per_second", "GPT-2 sampling throughput of the most recent generation")
+REQUESTS_IN_FLIGHT = Gauge("caption_requests_in_flight", "Requests running on an inference worker")
+REQUESTS_QUEUED = Gauge("caption_requests_queued", "Requests waiting for an inference worker")
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Observe the duration of the enclosed block in the stage latency histogram
+
+    The block is also a ``stage:<name>`` span in profiler traces.
+    """
+    start = time.perf_counter()
+    try:
+        with record_function(f"stage:{stage}"):
+            yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_request(format_type: str, outcome: str):
+    CAPTION_REQUESTS.labels(format=format_type, outcome=outcome).inc()
+
+
+def record_fallback(format_type: str, stage: str):
+    FALLBACK_CAPTIONS.labels(format=format_type, stage=stage).inc()
+
+
+def record_quality_tier(tier: str):
+    QUALITY_TIERS.labels(tier=tier).inc()
+
+
+def record_near_duplicate_lookup(hit: bool):
+    NEAR_DUPLICATE_LOOKUPS.labels(result="hit" if hit else "miss").inc()
+
+
+def record_base_fallback(count: int = 1):
+    BASE_FALLBACKS.inc(count)
+
+
+def record_tokens(count: int, seconds: float):
+    GPT2_TOKENS.inc(count)
+    if seconds > 0:
+        GPT2_TOKENS_PER_SECOND.set(count / seconds)
+
+
+def track_inference_pool(pool):
+    """Report the pool's in-flight and queued request counts at scrape time"""
+    REQUESTS_IN_FLIGHT.set_function(lambda: pool.in_flight)
+    REQUESTS_QUEUED.set_function(lambda: pool.queue_depth)
+
+
+def render() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text exposition format, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
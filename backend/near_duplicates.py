@@ -0,0 +1,181 @@
+"""
+Perceptual-hash index for reusing BLIP captions across near-identical images
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+HASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+# Hashes with fewer set (or unset) bits than this carry almost no structure
+MIN_HASH_BITS = 8
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy
+
+    Recompression, resizing and small crops or colour shifts flip only a few
+    bits, so similar images end up a small Hamming distance apart.
+    """
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def distinctive(image_hash: int, hash_size: int = HASH_SIZE) -> bool:
+    """Whether a hash says enough about an image to match it against others
+
+    Solid colours and smooth horizontal gradients all hash to (nearly) all
+    zeros or all ones, so a red square would reuse a blue square's caption.
+    """
+    bits = bin(image_hash).count("1")
+    return MIN_HASH_BITS <= bits <= hash_size * hash_size - MIN_HASH_BITS
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance
+
+    A search for everything within ``d`` of a hash only descends into
+    children whose edge distance is within ``d`` of the node's own distance,
+    which prunes most of the tree for small ``d``.
+    """
+
+    def __init__(self):
+        self.root: Optional[Tuple[int, str, Dict[int, tuple]]] = None
+        self.size = 0
+
+    def add(self, value: int, payload: str):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, payload, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, payload, {})
+                return
+            node = child
+
+    def nearest(self, value: int, max_distance: int) -> Optional[Tuple[int, str]]:
+        """(distance, payload) of the closest entry within ``max_distance``, or None"""
+        best = None
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+            for edge, child in node[2].items():
+                if abs(edge - distance) <= max_distance:
+                    stack.append(child)
+        return best
+
+
+class NearDuplicateIndex:
+    """Base captions keyed by perceptual hash, in a BK-tree backed by a SQLite table
+
+    Entries are grouped by ``scope`` (the BLIP model and generation settings)
+    so a caption is only reused under the settings that produced it. The
+    trees are loaded from disk on first use in each process; pass
+    ``path=None`` for a memory-only index.
+    """
+
+    def __init__(self, path: Optional[str], table: str = "near_duplicates", max_distance: int = 4, max_entries: int = 100000):
+        self.table = table
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+
+        self._trees: Dict[str, BKTree] = {}
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "exact_hits": 0}
+
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """SQLite connection, opened lazily and reopened in forked worker processes"""
+        if not self.path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # 64-bit hashes don't fit SQLite's signed integers, so they are stored as hex
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(scope TEXT NOT NULL, hash TEXT NOT NULL, caption TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, hash))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _tree(self, scope: str) -> BKTree:
+        tree = self._trees.get(scope)
+        if tree is None:
+            tree = BKTree()
+            if self._db is not None:
+                rows = self._db.execute(
+                    f"SELECT hash, caption FROM {self.table} WHERE scope = ? ORDER BY created_at DESC LIMIT ?",
+                    (scope, self.max_entries)
+                ).fetchall()
+                for value, caption in rows:
+                    tree.add(int(value, 16), caption)
+            self._trees[scope] = tree
+        return tree
+
+    def lookup(self, image_hash: int, scope: str) -> Optional[str]:
+        """Caption of the closest indexed image within ``max_distance``, or None"""
+        with self._lock:
+            self._stats["lookups"] += 1
+            match = self._tree(scope).nearest(image_hash, self.max_distance)
+            if match is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            if match[0] == 0:
+                self._stats["exact_hits"] += 1
+            return match[1]
+
+    def add(self, image_hash: int, caption: str, scope: str):
+        with self._lock:
+            tree = self._tree(scope)
+            if tree.size >= self.max_entries:
+                # BK-trees can't drop nodes cheaply; past the bound new images just aren't indexed
+                return
+            tree.add(image_hash, caption)
+
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (scope, hash, caption, created_at) VALUES (?, ?, ?, ?)",
+                    (scope, format(image_hash, "016x"), caption, time.time())
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": sum(tree.size for tree in self._trees.values()),
+            }
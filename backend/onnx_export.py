@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Export the caption models to ONNX for the onnx inference engine
+
+    python -m backend.onnx_export --output ./cache/onnx
+
+Writes the BLIP vision encoder, the BLIP text decoder (last-position logits
+given the image embeddings) and GPT-2 with past key/values inputs and
+outputs. Existing artifacts are kept unless ``--force`` is given.
+"""
+
+import argparse
+import inspect
+import os
+from typing import List
+
+import torch
+from torch import nn
+from transformers import BlipForConditionalGeneration, GPT2LMHeadModel
+
+from .caption_generator import CaptionGenerator
+from .engines import OnnxEngine
+
+OPSET_VERSION = 14
+
+
+class BlipVisionEncoder(nn.Module):
+    def __init__(self, blip_model: BlipForConditionalGeneration):
+        super().__init__()
+        self.vision_model = blip_model.vision_model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class BlipTextDecoderStep(nn.Module):
+    def __init__(self, blip_model: BlipForConditionalGeneration):
+        super().__init__()
+        self.text_decoder = blip_model.text_decoder
+
+    def forward(self, input_ids: torch.Tensor, encoder_hidden_states: torch.Tensor) -> torch.Tensor:
+        logits = self.text_decoder(
+            input_ids=input_ids,
+            encoder_hidden_states=encoder_hidden_states,
+            return_dict=True
+        ).logits
+        return logits[:, -1, :]
+
+
+class GPT2WithPast(nn.Module):
+    """GPT-2 with its past key/values flattened into plain graph inputs and outputs"""
+
+    def __init__(self, gpt2_model: GPT2LMHeadModel):
+        super().__init__()
+        self.model = gpt2_model
+        self.num_layers = gpt2_model.config.n_layer
+
+    def forward(self, input_ids, attention_mask, position_ids, *past_flat):
+        past = tuple((past_flat[2 * i], past_flat[2 * i + 1]) for i in range(self.num_layers))
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past,
+            use_cache=True,
+            return_dict=True
+        )
+        presents = [tensor for layer in outputs.past_key_values for tensor in layer]
+        return (outputs.logits, *presents)
+
+
+def past_names(prefix: str, num_layers: int) -> List[str]:
+    return [f"{prefix}.{i}.{kind}" for i in range(num_layers) for kind in ("key", "value")]
+
+
+def export(module: nn.Module, args: tuple, path: str, input_names, output_names, dynamic_axes):
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; these graphs use dynamic_axes
+        kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            module, args, path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET_VERSION,
+            do_constant_folding=True,
+            **kwargs
+        )
+    print(f"Exported {path}")
+
+
+def export_blip(model_name: str, output_dir: str, force: bool = False):
+    vision_path = os.path.join(output_dir, OnnxEngine.BLIP_VISION_FILE)
+    decoder_path = os.path.join(output_dir, OnnxEngine.BLIP_DECODER_FILE)
+    if not force and os.path.exists(vision_path) and os.path.exists(decoder_path):
+        print(f"BLIP artifacts already in {output_dir}")
+        return
+
+    blip_model = BlipForConditionalGeneration.from_pretrained(model_name).eval()
+    image_size = blip_model.config.vision_config.image_size
+    pixel_values = torch.randn(1, 3, image_size, image_size)
+
+    export(
+        BlipVisionEncoder(blip_model), (pixel_values,), vision_path,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}}
+    )
+
+    with torch.no_grad():
+        image_embeds = blip_model.vision_model(pixel_values=pixel_values)[0]
+    input_ids = torch.full((1, 3), blip_model.config.text_config.bos_token_id, dtype=torch.long)
+    export(
+        BlipTextDecoderStep(blip_model), (input_ids, image_embeds), decoder_path,
+        input_names=["input_ids", "encoder_hidden_states"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "encoder_hidden_states": {0: "batch"},
+            "logits": {0: "batch"},
+        }
+    )
+
+
+def export_gpt2(model_name: str, output_dir: str, force: bool = False):
+    path = os.path.join(output_dir, OnnxEngine.GPT2_FILE)
+    if not force and os.path.exists(path):
+        print(f"GPT-2 artifact already in {output_dir}")
+        return
+
+    gpt2_model = GPT2LMHeadModel.from_pretrained(model_name).eval()
+    config = gpt2_model.config
+    head_dim = config.n_embd // config.n_head
+
+    # Trace with a non-empty past so the concat with new keys/values stays dynamic
+    batch_size, past_length, new_length = 1, 2, 3
+    input_ids = torch.zeros((batch_size, new_length), dtype=torch.long)
+    attention_mask = torch.ones((batch_size, past_length + new_length), dtype=torch.long)
+    position_ids = torch.arange(past_length, past_length + new_length).unsqueeze(0)
+    past = [torch.zeros(batch_size, config.n_head, past_length, head_dim) for _ in range(2 * config.n_layer)]
+
+    past_inputs = past_names("past", config.n_layer)
+    present_outputs = past_names("present", config.n_layer)
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total_sequence"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    dynamic_axes.update({name: {0: "batch", 2: "past_sequence"} for name in past_inputs})
+    dynamic_axes.update({name: {0: "batch", 2: "total_sequence"} for name in present_outputs})
+
+    export(
+        GPT2WithPast(gpt2_model), (input_ids, attention_mask, position_ids, *past), path,
+        input_names=["input_ids", "attention_mask", "position_ids", *past_inputs],
+        output_names=["logits", *present_outputs],
+        dynamic_axes=dynamic_axes
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export BLIP and GPT-2 to ONNX for the onnx inference engine")
+    parser.add_argument("--output", default="./cache/onnx", help="Directory for the exported artifacts")
+    parser.add_argument("--force", action="store_true", help="Re-export even if artifacts exist")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    export_blip(CaptionGenerator.BLIP_MODEL_NAME, args.output, args.force)
+    export_gpt2(CaptionGenerator.GPT2_MODEL_NAME, args.output, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Reduced-precision inference modes for the caption models
+"""
+
+import torch
+from torch import nn
+from transformers.pytorch_utils import Conv1D
+
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+
+def bf16_supported(device: torch.device) -> bool:
+    """Whether bf16 matmuls are natively supported on this device"""
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def conv1d_to_linear(model: nn.Module) -> nn.Module:
+    """Swap GPT-2's Conv1D projections for equivalent nn.Linear layers
+
+    GPT-2 implements its attention and MLP projections as transformers'
+    Conv1D (a transposed Linear), which dynamic quantization would skip.
+    """
+    for name, child in model.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(model, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return model
+
+
+def apply_precision(model: nn.Module, precision: str, device: torch.device) -> nn.Module:
+    """Return ``model`` converted to the requested precision mode"""
+    if precision == "int8":
+        if device.type != "cpu":
+            print(f"int8 dynamic quantization is CPU-only, keeping fp32 on {device}")
+            return model
+        model = conv1d_to_linear(model)
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    if precision == "bf16":
+        if not bf16_supported(device):
+            print(f"bf16 is not supported on this {device.type}, keeping fp32")
+            return model
+        return model.to(torch.bfloat16)
+
+    return model
+
+
+def model_dtype(model: nn.Module) -> torch.dtype:
+    """Floating point dtype the model expects its inputs in"""
+    for param in model.parameters():
+        if param.is_floating_point():
+            return param.dtype
+    return torch.float32
+
+
+def _tensors(value):
+    if isinstance(value, torch.Tensor):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        # Packed params of quantized layers are stored as (weight, bias) tuples
+        for item in value:
+            yield from _tensors(item)
+
+
+def model_memory_bytes(model: nn.Module) -> int:
+    """Bytes held by the model's weights and buffers, including quantized packed weights"""
+    seen = set()
+    total = 0
+    for value in model.state_dict().values():
+        for tensor in _tensors(value):
+            # Tied weights (e.g. GPT-2's embeddings and LM head) are counted once
+            key = tensor.data_ptr() if not tensor.is_quantized else id(tensor)
+            if key in seen:
+                continue
+            seen.add(key)
+            total += tensor.element_size() * tensor.nelement()
+    return total
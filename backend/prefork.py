@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Pre-fork server: load the caption models once, then fork workers that share them
+
+    python -m backend.prefork --workers 4 --threads 2
+
+The parent loads CaptionGenerator, moves its weights into shared memory and
+freezes the Python heap, then forks N uvicorn workers that all accept on the
+same listening socket. Workers only read the weights, so resident memory
+grows with per-worker activations and buffers rather than a full model copy
+per process.
+
+With ``INFERENCE_ENGINE=onnx`` nothing is loaded before fork: ONNX Runtime
+sessions and their thread pools are not fork-safe, so each worker builds its
+own, sized by ``--threads``.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+import torch
+import uvicorn
+
+from . import config
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, threads: int):
+    """Child process: size torch's thread pool, warm up, then serve on the shared socket"""
+    from .api import app, caption_generator
+
+    # Each worker gets its own slice of the cores instead of all of them
+    torch.set_num_threads(threads)
+    # Models the parent didn't load (ONNX) are loaded by the app's startup, with this thread count
+    if caption_generator.is_ready:
+        caption_generator.warm_up()
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def spawn_worker(sock: socket.socket, threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            run_worker(sock, threads)
+        except Exception as e:
+            print(f"Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, threads: int):
+    from .api import caption_generator
+
+    # Load in the parent on a single thread: forking after OpenMP has spun up
+    # its thread pool is unsafe, so the workers size their own pools
+    torch.set_num_threads(1)
+    if caption_generator.engine_name == "torch":
+        print(f"Loading models once in the parent process ({os.getpid()})...")
+        caption_generator.load_models(warm_up=False)
+        caption_generator.share_memory()
+    else:
+        print(f"{caption_generator.engine_name} engine: each worker loads its own models")
+
+    # Keep the garbage collector from touching (and so copying) inherited objects
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(host, port)
+    children: Dict[int, int] = {}
+    for index in range(workers):
+        children[spawn_worker(sock, threads)] = index
+    print(f"Serving on http://{host}:{port} with {workers} workers x {threads} threads")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+
+        # Replace workers that died unexpectedly
+        print(f"Worker {pid} exited with status {status}, restarting")
+        time.sleep(1)
+        children[spawn_worker(sock, threads)] = index
+
+    sock.close()
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Pre-fork caption API server with shared model weights")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=config.PREFORK_WORKERS)
+    parser.add_argument(
+        "--threads", type=int, default=config.WORKER_THREADS,
+        help="torch intra-op threads per worker (default: cores / workers)"
+    )
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("Pre-fork serving needs a platform with fork()")
+
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, cpu_count // workers)
+    serve(args.host, args.port, workers, threads)
+
+
+if __name__ == "__main__":
+    main()
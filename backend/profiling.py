@@ -0,0 +1,81 @@
+"""
+Opt-in torch.profiler traces for individual caption requests
+"""
+
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+
+TRACE_SUFFIX = ".trace.json"
+TRACE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ProfilerBusyError(Exception):
+    """Raised when another request in this process is already being profiled"""
+
+
+class RequestProfiler:
+    """Profiles single requests into Chrome/Perfetto trace files
+
+    Only one request per process is profiled at a time: Kineto supports a
+    single active profiler and raises if a second one starts. Only the
+    newest ``max_traces`` trace files are kept in ``trace_dir``.
+    """
+
+    def __init__(self, trace_dir: str, max_traces: int = 20):
+        self.trace_dir = trace_dir
+        self.max_traces = max_traces
+        self._busy = threading.Lock()
+
+    def trace_path(self, trace_id: str) -> Optional[str]:
+        """Path of a retained trace, or None for unknown (or malformed) ids"""
+        if not TRACE_ID_PATTERN.match(trace_id):
+            return None
+        path = os.path.join(self.trace_dir, trace_id + TRACE_SUFFIX)
+        return path if os.path.exists(path) else None
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[str]:
+        """Profile the enclosed block under a ``name`` span and yield the trace id it is saved as
+
+        Spans from ``metrics.stage_timer`` show up as ``stage:<name>`` in the
+        trace. Raises ProfilerBusyError instead of waiting for a free slot.
+        """
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusyError("Another profiled request is in progress")
+
+        try:
+            trace_id = uuid.uuid4().hex
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+
+            with profile(activities=activities, record_shapes=True) as prof:
+                with record_function(name):
+                    yield trace_id
+
+            os.makedirs(self.trace_dir, exist_ok=True)
+            prof.export_chrome_trace(os.path.join(self.trace_dir, trace_id + TRACE_SUFFIX))
+            self._prune()
+        finally:
+            self._busy.release()
+
+    def _prune(self):
+        """Delete the oldest traces beyond ``max_traces``"""
+        traces = [
+            os.path.join(self.trace_dir, name)
+            for name in os.listdir(self.trace_dir) if name.endswith(TRACE_SUFFIX)
+        ]
+        traces.sort(key=os.path.getmtime, reverse=True)
+        for path in traces[self.max_traces:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker process pruned it first
+                pass
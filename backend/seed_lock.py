@@ -0,0 +1,52 @@
+"""
+Shared/exclusive lock around the process-global torch RNG
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SharedExclusiveLock:
+    """Readers-writer lock: any number of shared holders, or one exclusive holder
+
+    Unseeded sampling only draws from the global RNG, so it may run
+    concurrently (``shared``); a seeded run reseeds it and needs it to itself
+    (``exclusive``). Waiting exclusive holders go first, so a steady stream of
+    unseeded requests can't starve seeded ones.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            while self._exclusive or self._exclusive_waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            self._exclusive_waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
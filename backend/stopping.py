@@ -0,0 +1,82 @@
+"""
+Sentence-aware early stopping for GPT-2 caption sampling
+
+clean_caption keeps roughly the first complete sentence of what GPT-2
+writes, so tokens sampled past that point are paid for and thrown away.
+``caption_end`` finds where a caption is complete and
+``SentenceStoppingCriteria`` ends generation there.
+"""
+
+import re
+from typing import List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+# ".", "!" or "?" (possibly repeated, possibly closing a quote) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+# A run of hashtags, each followed by whitespace, i.e. already complete
+HASHTAG = re.compile(r"#\w+")
+HASHTAG_RUN = re.compile(r"(?:#\w+\s+)+")
+MAX_GENERATED_HASHTAGS = 3
+
+
+def caption_end(text: str, min_chars: int) -> Optional[int]:
+    """Index where the caption in ``text`` is complete, or None if it may still continue
+
+    A caption ends at the first newline, sentence end or run of
+    ``MAX_GENERATED_HASHTAGS`` complete hashtags once it has ``min_chars``
+    characters (leading whitespace not counted). A sentence end only counts
+    once the next character is known to be whitespace, so "3.5" or "..."
+    don't end it early.
+    """
+    min_end = len(text) - len(text.lstrip()) + min_chars
+    ends = []
+
+    newline = text.find("\n", min_end)
+    if newline != -1:
+        ends.append(newline)
+
+    for match in SENTENCE_END.finditer(text):
+        if match.end() >= min_end:
+            ends.append(match.end())
+            break
+
+    # Hashtags written inline are part of the prose; a run of several ends the caption
+    for match in HASHTAG_RUN.finditer(text):
+        tags = list(HASHTAG.finditer(match.group()))
+        if len(tags) >= MAX_GENERATED_HASHTAGS:
+            end = match.start() + tags[MAX_GENERATED_HASHTAGS - 1].end()
+            if end >= min_end:
+                ends.append(end)
+                break
+
+    return min(ends) if ends else None
+
+
+class SentenceStoppingCriteria(StoppingCriteria):
+    """Stop sampling once every sequence in the batch holds a complete caption
+
+    Only the tokens after ``prompt_length`` are decoded. Rows that are done
+    stay done, so a batch stops as soon as its slowest caption is complete;
+    ``stopped(row)`` tells which rows had their caption end detected.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, min_chars: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.min_chars = min_chars
+        self.done: Optional[List[bool]] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Optional[torch.FloatTensor] = None, **kwargs) -> bool:
+        if self.done is None:
+            self.done = [False] * input_ids.shape[0]
+        for row, finished in enumerate(self.done):
+            if not finished:
+                text = self.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+                self.done[row] = caption_end(text, self.min_chars) is not None
+        return all(self.done)
+
+    def stopped(self, row: int) -> bool:
+        """Whether generation reached the end of row ``row``'s caption (as opposed to running out of tokens)"""
+        return bool(self.done and self.done[row])
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Check the ONNX Runtime engine against the PyTorch engine
+
+Runs both engines on the same inputs and fails (exit status 1) unless
+
+    BLIP token ids match exactly, greedy and with beam search,
+    seeded GPT-2 samples match token for token, and
+    GPT-2 next-token logits differ by at most --max-logit-diff.
+
+It also reports whether full base and seeded enhanced captions match and
+per-stage latency for both engines. ``--tiny`` builds small random BLIP and
+GPT-2 models and exports them to a temp directory, so the check runs without
+the real weights (no network, a few seconds on CPU); use it in CI.
+
+    python -m benchmarks.compare_engines --tiny
+    python -m backend.onnx_export --output ./cache/onnx
+    python -m benchmarks.compare_engines --images ./samples --onnx-dir ./cache/onnx
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+from PIL import Image
+
+from backend.caption_generator import CaptionGenerator
+from benchmarks.compare_precision import load_images
+
+
+def run_engine(generator: CaptionGenerator, images: Dict[str, Image.Image], format_type: str, seed: int) -> Dict:
+    """Caption every image with one engine, timing each stage"""
+    generator.warm_up()
+
+    captions = {}
+    blip_times: List[float] = []
+    gpt2_times: List[float] = []
+    for name, image in images.items():
+        start = time.perf_counter()
+        base_caption = generator.generate_base_captions([image])[0]
+        blip_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        enhanced_caption = generator.enhance_caption(base_caption, format_type, seed=seed)
+        gpt2_times.append(time.perf_counter() - start)
+
+        captions[name] = {"base": base_caption, "enhanced": enhanced_caption}
+
+    return {
+        "engine": generator.engine_name,
+        "memory_mb": {model: round(size / 2**20, 1) for model, size in generator.model_memory.items()},
+        "latency_ms": {
+            "blip_mean": round(statistics.mean(blip_times) * 1000, 1),
+            "gpt2_mean": round(statistics.mean(gpt2_times) * 1000, 1),
+        },
+        "captions": captions,
+    }
+
+
+def max_logit_diff(torch_generator: CaptionGenerator, onnx_generator: CaptionGenerator, prompts: List[str]) -> float:
+    """Largest absolute difference between the engines' GPT-2 next-token logits"""
+    worst = 0.0
+    for prompt in prompts:
+        input_ids = torch_generator.gpt2_tokenizer.encode(prompt, return_tensors="pt")
+        with torch.no_grad():
+            expected = torch_generator.engine.gpt2_model(input_ids).logits[:, -1, :].float()
+
+        onnx_engine = onnx_generator.engine
+        actual, _ = onnx_engine._run_gpt2(input_ids, torch.ones_like(input_ids), onnx_engine._empty_past(1))
+        worst = max(worst, (expected - actual).abs().max().item())
+    return worst
+
+
+def without_padding(ids: torch.Tensor, pad_token_id: int) -> List[List[int]]:
+    """Token id rows with trailing padding removed, so sequences of different padded length compare equal"""
+    rows = []
+    for row in ids.tolist():
+        while row and row[-1] == pad_token_id:
+            row.pop()
+        rows.append(row)
+    return rows
+
+
+def base_token_match(
+    torch_generator: CaptionGenerator, onnx_generator: CaptionGenerator, images: Dict[str, Image.Image], num_beams: int
+) -> float:
+    """Share of images whose BLIP token ids are identical under both engines"""
+    max_length = torch_generator.blip_generate_kwargs['max_length']
+    pad_token_id = onnx_generator.engine.blip_pad_token_id
+    matches = 0
+    for image in images.values():
+        pixel_values = torch_generator.blip_processor([image], return_tensors="pt")['pixel_values']
+        expected = torch_generator.engine.generate_base(pixel_values, max_length=max_length, num_beams=num_beams)
+        actual = onnx_generator.engine.generate_base(pixel_values, max_length=max_length, num_beams=num_beams)
+        matches += without_padding(expected, pad_token_id) == without_padding(actual, pad_token_id)
+    return matches / len(images)
+
+
+def sampled_token_match(
+    torch_generator: CaptionGenerator, onnx_generator: CaptionGenerator, prompts: List[str], seed: int
+) -> float:
+    """Share of prompts whose seeded GPT-2 samples are identical under both engines
+
+    The torch engine draws from the global RNG after ``torch.manual_seed``,
+    the ONNX engine from its own generator with the same seed, as in
+    ``CaptionGenerator.sample_gpt2``.
+    """
+    tokenizer = torch_generator.gpt2_tokenizer
+    matches = 0
+    for prompt in prompts:
+        input_ids = tokenizer.encode(prompt, return_tensors="pt")
+        kwargs = dict(
+            max_new_tokens=torch_generator.gpt2_max_new_tokens,
+            temperature=torch_generator.gpt2_temperature,
+            pad_token_id=tokenizer.eos_token_id,
+        )
+        torch.manual_seed(seed)
+        expected = torch_generator.engine.generate_text(input_ids, torch.ones_like(input_ids), **kwargs)
+        actual = onnx_generator.engine.generate_text(
+            input_ids, torch.ones_like(input_ids), generator=torch.Generator().manual_seed(seed), **kwargs
+        )
+        matches += without_padding(expected, tokenizer.eos_token_id) == without_padding(actual, tokenizer.eos_token_id)
+    return matches / len(prompts)
+
+
+def synthetic_images(count: int = 4) -> Dict[str, Image.Image]:
+    """Random-noise test images for --tiny runs without --images"""
+    rng = np.random.default_rng(0)
+    return {
+        f"synthetic_{i}.png": Image.fromarray(rng.integers(0, 256, (384, 384, 3), dtype=np.uint8))
+        for i in range(count)
+    }
+
+
+def load_generators(args, work_dir: str):
+    """Torch and ONNX CaptionGenerators over the same (real or tiny) models"""
+    onnx_dir = args.onnx_dir
+    model_names = {}
+    if args.tiny:
+        # Imported here: stage_benchmark switches the Hub to offline mode on import
+        from backend.onnx_export import export_blip, export_gpt2
+        from benchmarks.stage_benchmark import build_tiny_models
+
+        model_names = build_tiny_models(work_dir)
+        onnx_dir = os.path.join(work_dir, "onnx")
+        os.makedirs(onnx_dir)
+        export_blip(model_names["blip"], onnx_dir)
+        export_gpt2(model_names["gpt2"], onnx_dir)
+
+    generators = []
+    for engine in ("torch", "onnx"):
+        generator = CaptionGenerator(max_batch_size=1, lazy_load=True, engine=engine, onnx_dir=onnx_dir)
+        if model_names:
+            generator.BLIP_MODEL_NAME = model_names["blip"]
+            generator.GPT2_MODEL_NAME = model_names["gpt2"]
+        generator.load_models()
+        generators.append(generator)
+    return generators
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the ONNX Runtime engine against PyTorch")
+    parser.add_argument("--images", help="Folder of local test images (default with --tiny: synthetic images)")
+    parser.add_argument("--onnx-dir", default="./cache/onnx", help="Directory written by backend.onnx_export")
+    parser.add_argument("--tiny", action="store_true", help="Check tiny random models, exported to a temp directory")
+    parser.add_argument("--format", default="casual", help="Caption format used for the GPT-2 stage")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed so GPT-2 output is comparable")
+    parser.add_argument("--max-logit-diff", type=float, default=1e-3, help="Largest GPT-2 logit difference that passes")
+    parser.add_argument("--output", help="Write full results (including captions) as JSON")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images)
+    elif args.tiny:
+        images = synthetic_images()
+    else:
+        sys.exit("Pass --images, or --tiny to check tiny models on synthetic images")
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        torch_generator, onnx_generator = load_generators(args, work_dir)
+        results = [run_engine(generator, images, args.format, args.seed) for generator in (torch_generator, onnx_generator)]
+
+        reference, candidate = results
+        names = list(images)
+        base_match = sum(candidate["captions"][n]["base"] == reference["captions"][n]["base"] for n in names)
+        enhanced_match = sum(candidate["captions"][n]["enhanced"] == reference["captions"][n]["enhanced"] for n in names)
+        prompts = [
+            torch_generator.build_prompt(reference["captions"][n]["base"], torch_generator.format_templates[args.format])
+            for n in names
+        ]
+        equivalence = {
+            "base_exact_match": round(base_match / len(names), 3),
+            "enhanced_exact_match": round(enhanced_match / len(names), 3),
+            "blip_greedy_token_match": base_token_match(torch_generator, onnx_generator, images, num_beams=1),
+            "blip_beam_token_match": base_token_match(
+                torch_generator, onnx_generator, images, num_beams=torch_generator.blip_generate_kwargs['num_beams']
+            ),
+            "gpt2_seeded_token_match": sampled_token_match(torch_generator, onnx_generator, prompts, args.seed),
+            "gpt2_max_logit_diff": max_logit_diff(torch_generator, onnx_generator, prompts),
+        }
+
+    print(f"{'engine':<6} {'blip MB':>8} {'gpt2 MB':>8} {'blip ms':>8} {'gpt2 ms':>8}")
+    for result in results:
+        print(
+            f"{result['engine']:<6} "
+            f"{result['memory_mb']['blip']:>8} {result['memory_mb']['gpt2']:>8} "
+            f"{result['latency_ms']['blip_mean']:>8} {result['latency_ms']['gpt2_mean']:>8}"
+        )
+    print(
+        f"base captions identical: {equivalence['base_exact_match']:.0%}, "
+        f"seeded enhanced captions identical: {equivalence['enhanced_exact_match']:.0%}, "
+        f"max GPT-2 logit diff: {equivalence['gpt2_max_logit_diff']:.2e}"
+    )
+
+    failures = [
+        f"{check} is {equivalence[check]:.0%}, expected 100%"
+        for check in ("blip_greedy_token_match", "blip_beam_token_match", "gpt2_seeded_token_match")
+        if equivalence[check] < 1.0
+    ]
+    if equivalence["gpt2_max_logit_diff"] > args.max_logit_diff:
+        failures.append(f"gpt2_max_logit_diff is {equivalence['gpt2_max_logit_diff']:.2e}, above {args.max_logit_diff:.0e}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"equivalence": equivalence, "failures": failures, "results": results}, f, indent=2)
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: token ids and seeded samples match")
+
+
+if __name__ == "__main__":
+    main()
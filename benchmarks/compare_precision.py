@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Compare caption output, latency and memory across inference precision modes
+
+Runs every image in a local folder through CaptionGenerator in each mode and
+reports how far base (BLIP) and enhanced (GPT-2, fixed seed) captions drift
+from the fp32 reference, alongside per-stage latency and model footprint.
+
+    python -m benchmarks.compare_precision --images ./samples --modes fp32 int8 bf16
+"""
+
+import argparse
+import difflib
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from PIL import Image
+
+from backend.caption_generator import CaptionGenerator
+from backend.precision import PRECISION_MODES
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+
+def load_images(folder: str) -> Dict[str, Image.Image]:
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return {name: Image.open(os.path.join(folder, name)).convert('RGB') for name in names}
+
+
+def similarity(a: str, b: str) -> float:
+    """Word-level similarity between two captions, 1.0 meaning identical"""
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+def run_mode(precision: str, images: Dict[str, Image.Image], format_type: str, seed: int) -> Dict:
+    """Caption every image in one precision mode, timing each stage"""
+    generator = CaptionGenerator(max_batch_size=1, precision=precision)
+    generator.warm_up()
+
+    captions = {}
+    blip_times: List[float] = []
+    gpt2_times: List[float] = []
+    for name, image in images.items():
+        start = time.perf_counter()
+        base_caption = generator.generate_base_caption(image)
+        blip_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        enhanced_caption = generator.enhance_caption(base_caption, format_type, seed=seed)
+        gpt2_times.append(time.perf_counter() - start)
+
+        captions[name] = {"base": base_caption, "enhanced": enhanced_caption}
+
+    result = {
+        "precision": precision,
+        "memory_mb": {model: round(size / 2**20, 1) for model, size in generator.model_memory.items()},
+        "latency_ms": {
+            "blip_mean": round(statistics.mean(blip_times) * 1000, 1),
+            "gpt2_mean": round(statistics.mean(gpt2_times) * 1000, 1),
+        },
+        "captions": captions,
+    }
+
+    del generator
+    gc.collect()
+    return result
+
+
+def add_drift(results: List[Dict]):
+    """Annotate each mode with its caption drift against the fp32 run"""
+    reference = next((r for r in results if r["precision"] == "fp32"), None)
+    if reference is None:
+        return
+
+    for result in results:
+        base_scores, enhanced_scores, exact = [], [], 0
+        for name, captions in result["captions"].items():
+            expected = reference["captions"][name]
+            base_scores.append(similarity(captions["base"], expected["base"]))
+            enhanced_scores.append(similarity(captions["enhanced"], expected["enhanced"]))
+            exact += captions["base"] == expected["base"]
+
+        result["drift"] = {
+            "base_exact_match": round(exact / len(base_scores), 3),
+            "base_similarity": round(statistics.mean(base_scores), 3),
+            "enhanced_similarity": round(statistics.mean(enhanced_scores), 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare caption precision modes against fp32")
+    parser.add_argument("--images", required=True, help="Folder of local test images")
+    parser.add_argument("--modes", nargs="+", default=list(PRECISION_MODES), choices=PRECISION_MODES)
+    parser.add_argument("--format", default="casual", help="Caption format used for the GPT-2 stage")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed so GPT-2 output is comparable")
+    parser.add_argument("--output", help="Write full results (including captions) as JSON")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    # fp32 is the reference, so always run it first
+    modes = ["fp32"] + [mode for mode in args.modes if mode != "fp32"]
+    results = [run_mode(mode, images, args.format, args.seed) for mode in modes]
+    add_drift(results)
+
+    print(f"{'mode':<6} {'blip MB':>8} {'gpt2 MB':>8} {'blip ms':>8} {'gpt2 ms':>8} {'base =':>7} {'base ~':>7} {'enh ~':>7}")
+    for result in results:
+        drift = result.get("drift", {})
+        print(
+            f"{result['precision']:<6} "
+            f"{result['memory_mb']['blip']:>8} {result['memory_mb']['gpt2']:>8} "
+            f"{result['latency_ms']['blip_mean']:>8} {result['latency_ms']['gpt2_mean']:>8} "
+            f"{drift.get('base_exact_match', '-'):>7} {drift.get('base_similarity', '-'):>7} "
+            f"{drift.get('enhanced_similarity', '-'):>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Offline per-stage micro-benchmarks for the caption pipeline
+
+Times each stage of ``CaptionGenerator.generate_caption`` on its own:
+
+    decode           upload bytes -> RGB image (backend.image_io.load_image), per image size
+    blip_preprocess  BlipProcessor resize/normalise, per batch size
+    blip_generate    BLIP caption generation, per batch size and beam count
+    gpt2_generate    GPT-2 prompt encoding and sampling, per format
+    postprocess      clean_caption + add_format_elements, per format
+
+and reports p50/p95/p99 latency and throughput, optionally as JSON that a
+later run can be compared against with ``--baseline``. No network is used:
+when the real BLIP/GPT-2 weights are not in the Hugging Face cache (or with
+``--tiny``) small randomly initialised models are built in a temp directory,
+which is enough to compare code paths but not real-model latency.
+
+    python -m benchmarks.stage_benchmark --output stages.json
+    python -m benchmarks.stage_benchmark --baseline stages.json
+"""
+
+import os
+
+# Never reach out to the Hub, even for a config lookup
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+from huggingface_hub import try_to_load_from_cache
+from PIL import Image
+
+from backend.caption_generator import CaptionGenerator
+from backend.engines import ENGINES
+from backend.image_io import load_image
+
+WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+
+
+def weights_cached(model_name: str) -> bool:
+    """Whether config and weights for ``model_name`` are already in the local Hugging Face cache"""
+    if not isinstance(try_to_load_from_cache(model_name, "config.json"), str):
+        return False
+    return any(isinstance(try_to_load_from_cache(model_name, name), str) for name in WEIGHT_FILES)
+
+
+def build_tiny_models(directory: str) -> Dict[str, str]:
+    """Save randomly initialised BLIP and GPT-2 models with matching tokenizers under ``directory``"""
+    from transformers import (
+        BertTokenizer,
+        BlipConfig,
+        BlipForConditionalGeneration,
+        BlipImageProcessor,
+        BlipProcessor,
+        GPT2Config,
+        GPT2LMHeadModel,
+        GPT2Tokenizer,
+    )
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+    torch.manual_seed(0)
+
+    # GPT-2: byte-level vocabulary without merges, so every byte is one token
+    gpt2_dir = os.path.join(directory, "gpt2")
+    os.makedirs(gpt2_dir, exist_ok=True)
+    vocab = {char: i for i, char in enumerate(bytes_to_unicode().values())}
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(gpt2_dir, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(gpt2_dir, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+    GPT2Tokenizer(os.path.join(gpt2_dir, "vocab.json"), os.path.join(gpt2_dir, "merges.txt")).save_pretrained(gpt2_dir)
+    eos_token_id = vocab["<|endoftext|>"]
+    gpt2_config = GPT2Config(n_layer=2, n_embd=64, n_head=2, vocab_size=len(vocab), bos_token_id=eos_token_id, eos_token_id=eos_token_id)
+    GPT2LMHeadModel(gpt2_config).save_pretrained(gpt2_dir)
+
+    # BLIP: a small word-piece vocabulary, full-size image preprocessing
+    blip_dir = os.path.join(directory, "blip")
+    os.makedirs(blip_dir, exist_ok=True)
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list("abcdefghijklmnopqrstuvwxyz")
+    words += ["dog", "cat", "on", "the", "beach", "photo", "of", "with", "sunset"]
+    with open(os.path.join(blip_dir, "vocab.txt"), "w") as f:
+        f.write("\n".join(words) + "\n")
+    tokenizer = BertTokenizer(os.path.join(blip_dir, "vocab.txt"))
+    tokenizer.add_special_tokens({"bos_token": "[DEC]"})
+    BlipProcessor(BlipImageProcessor(), tokenizer).save_pretrained(blip_dir)
+    blip_config = BlipConfig(
+        vision_config=dict(hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2, image_size=384, patch_size=32),
+        text_config=dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+            vocab_size=len(tokenizer), encoder_hidden_size=32,
+            bos_token_id=tokenizer.bos_token_id, pad_token_id=tokenizer.pad_token_id, sep_token_id=tokenizer.sep_token_id
+        )
+    )
+    BlipForConditionalGeneration(blip_config).save_pretrained(blip_dir)
+
+    return {"blip": blip_dir, "gpt2": gpt2_dir}
+
+
+def summarize(samples: List[float], items_per_sample: int = 1) -> Dict:
+    """Latency percentiles (ms) and throughput (items/s) for one benchmark case"""
+    ms = np.array(samples) * 1000
+    return {
+        "runs": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "throughput_per_s": round(items_per_sample * len(samples) / sum(samples), 2),
+    }
+
+
+def time_case(fn: Callable[[], object], repeats: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def synthetic_jpeg(size: int) -> bytes:
+    """Noisy square JPEG, so decode cost resembles a photo rather than a flat colour"""
+    rng = np.random.default_rng(size)
+    pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def run_benchmarks(generator: CaptionGenerator, args) -> List[Dict]:
+    cases = []
+
+    def record(stage: str, params: Dict, samples: List[float], items: int = 1):
+        cases.append({"stage": stage, "params": params, **summarize(samples, items)})
+
+    uploads = {size: synthetic_jpeg(size) for size in args.sizes}
+    for size, data in uploads.items():
+        record("decode", {"image_size": size}, time_case(lambda: load_image(data), args.repeats, args.warmup))
+
+    image = load_image(uploads[max(args.sizes)])
+    for batch_size in args.batch_sizes:
+        images = [image] * batch_size
+        samples = time_case(lambda: generator.blip_processor(images, return_tensors="pt"), args.repeats, args.warmup)
+        record("blip_preprocess", {"batch_size": batch_size}, samples, batch_size)
+
+        pixel_values = generator.blip_processor(images, return_tensors="pt")["pixel_values"]
+        for num_beams in args.beams:
+            def blip_generate():
+                return generator.engine.generate_base(pixel_values, max_length=generator.blip_generate_kwargs["max_length"], num_beams=num_beams)
+            samples = time_case(blip_generate, args.repeats, args.warmup)
+            record("blip_generate", {"batch_size": batch_size, "num_beams": num_beams}, samples, batch_size)
+
+    base_caption = generator.generate_base_captions([image])[0]
+    for format_type in args.formats:
+        template = generator.format_templates[format_type]
+
+        def gpt2_generate():
+            input_ids, past_key_values = generator.encode_prompt(base_caption, format_type)
+            outputs = generator.sample_gpt2(args.seed, input_ids, torch.ones_like(input_ids), past_key_values=past_key_values)
+            return generator.gpt2_tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+        samples = time_case(gpt2_generate, args.repeats, args.warmup)
+        record("gpt2_generate", {"format": format_type}, samples)
+
+        generated_text = gpt2_generate()
+        samples = time_case(lambda: generator.finish_caption(generated_text, template), args.repeats, args.warmup)
+        record("postprocess", {"format": format_type}, samples)
+
+    return cases
+
+
+def case_key(case: Dict) -> str:
+    return case["stage"] + " " + " ".join(f"{k}={v}" for k, v in sorted(case["params"].items()))
+
+
+def print_report(cases: List[Dict], baseline: Dict = None):
+    previous = {case_key(case): case for case in baseline["cases"]} if baseline else {}
+    header = f"{'case':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>9}"
+    print(header + (f" {'p50 vs base':>12}" if previous else ""))
+    for case in cases:
+        key = case_key(case)
+        line = f"{key:<40} {case['p50_ms']:>9} {case['p95_ms']:>9} {case['p99_ms']:>9} {case['throughput_per_s']:>9}"
+        if key in previous and previous[key]["p50_ms"]:
+            change = case["p50_ms"] / previous[key]["p50_ms"] - 1
+            line += f" {change:>+12.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each caption pipeline stage separately")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[256, 1024, 4096], help="Square upload sizes for the decode stage")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8], help="BLIP batch sizes")
+    parser.add_argument("--beams", nargs="+", type=int, default=[1, 5], help="BLIP beam counts")
+    parser.add_argument("--formats", nargs="+", default=None, help="Caption formats for the GPT-2 and post-processing stages (default: all)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per case")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per case")
+    parser.add_argument("--seed", type=int, default=0, help="GPT-2 sampling seed, so every run samples the same tokens")
+    parser.add_argument("--engine", default="torch", choices=ENGINES)
+    parser.add_argument("--no-early-stop", action="store_true", help="Always sample the full GPT-2 token budget")
+    parser.add_argument("--onnx-dir", default="./cache/onnx", help="Exported models for --engine onnx")
+    parser.add_argument("--tiny", action="store_true", help="Use tiny random models even if the real weights are cached")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare p50 latency against")
+    args = parser.parse_args()
+
+    use_tiny = args.tiny or not (weights_cached(CaptionGenerator.BLIP_MODEL_NAME) and weights_cached(CaptionGenerator.GPT2_MODEL_NAME))
+    if use_tiny and args.engine == "onnx":
+        sys.exit("The onnx engine needs exported real models; run the tiny benchmark with --engine torch")
+
+    with tempfile.TemporaryDirectory() as tiny_dir:
+        generator = CaptionGenerator(
+            max_batch_size=1, lazy_load=True, engine=args.engine, onnx_dir=args.onnx_dir,
+            stop_at_caption_end=not args.no_early_stop,
+        )
+        if use_tiny:
+            print("Real weights not cached (or --tiny given), using tiny random models")
+            paths = build_tiny_models(tiny_dir)
+            generator.BLIP_MODEL_NAME = paths["blip"]
+            generator.GPT2_MODEL_NAME = paths["gpt2"]
+        generator.load_models()
+
+        args.formats = args.formats or list(generator.format_templates)
+        unknown = [f for f in args.formats if f not in generator.format_templates]
+        if unknown:
+            sys.exit(f"Unknown formats: {', '.join(unknown)}")
+
+        cases = run_benchmarks(generator, args)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "models": "tiny" if use_tiny else "pretrained",
+        "engine": args.engine,
+        "torch_version": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cases": cases,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("models") != results["models"]:
+            print(f"Warning: baseline used {baseline.get('models')} models, this run used {results['models']}")
+    print_report(cases, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,42 @@
 import streamlit as st
 import requests
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+import hashlib
 import io
+import os
+import sys
 import time
 import json
 import base64
 from datetime import datetime
 import uuid
 
+# `streamlit run frontend/app.py` only puts frontend/ on sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.image_io import UploadError
+from frontend.post_store import PostStore
+
+# Caption backend: "http" calls the API (see backend/api.py), "local" runs CaptionGenerator in this process
+CAPTION_BACKEND = os.getenv("CAPTION_BACKEND", "http")
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3.05"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "120"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "3"))
+# "all_formats" captions every selected style from one backend call, "parallel" sends one request per style
+MULTI_FORMAT_MODE = os.getenv("MULTI_FORMAT_MODE", "all_formats")
+
+# Saved posts keep small renditions on disk instead of the full upload in session state
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "./cache/thumbnails")
+GRID_THUMBNAIL_SIZE = 320
+FEED_IMAGE_SIZE = 1080
+GRID_PAGE_SIZE = 12
+FEED_PAGE_SIZE = 5
+POST_STORE_PATH = os.getenv("POST_STORE_PATH", "./cache/posts.sqlite3")
+UPLOAD_PREVIEW_SIZE = 1080
+
 # Page configuration
 st.set_page_config(
     page_title="AI Caption Generator - Instagram Preview",
@@ -136,13 +165,178 @@ if 'generated_captions' not in st.session_state:
     st.session_state.generated_captions = {}
 if 'current_image' not in st.session_state:
     st.session_state.current_image = None
-if 'saved_posts' not in st.session_state:
-    st.session_state.saved_posts = []
 if 'auto_copy' not in st.session_state:
     st.session_state.auto_copy = False
 if 'view_mode' not in st.session_state:
     st.session_state.view_mode = 'generator'
 
+@st.cache_resource
+def get_backend_session():
+    """Keep-alive HTTP session shared by all reruns and users, retrying connection errors and 502/503/504"""
+    retry = Retry(
+        total=BACKEND_RETRIES,
+        # A read timeout means the backend may already be captioning the upload; retrying would run it twice
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        # The backend answers 503 before doing any work, so retrying the upload is safe
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource(show_spinner="🤖 Loading the caption models...")
+def get_local_caption_generator():
+    """One CaptionGenerator for every rerun and session in this process (CAPTION_BACKEND=local)"""
+    # Imported here so the HTTP mode doesn't pull in torch and transformers
+    from backend import config
+    from backend.cache import CaptionCache
+    from backend.caption_generator import CaptionGenerator
+    from backend.near_duplicates import NearDuplicateIndex
+    
+    generator = CaptionGenerator(
+        max_batch_size=config.BLIP_MAX_BATCH_SIZE,
+        batch_wait_ms=config.BLIP_BATCH_WAIT_MS,
+        base_cache=CaptionCache(
+            config.CAPTION_CACHE_PATH or None, "base_captions",
+            max_entries=config.CAPTION_CACHE_MEMORY_ENTRIES,
+            max_disk_entries=config.CAPTION_CACHE_DISK_ENTRIES,
+        ),
+        enhanced_cache=CaptionCache(
+            config.CAPTION_CACHE_PATH or None, "enhanced_captions",
+            max_entries=config.CAPTION_CACHE_MEMORY_ENTRIES,
+            max_disk_entries=config.CAPTION_CACHE_DISK_ENTRIES,
+        ),
+        lazy_load=True,
+        precision=config.MODEL_PRECISION,
+        engine=config.INFERENCE_ENGINE,
+        onnx_dir=config.ONNX_MODEL_DIR,
+        enhancer_by_format=config.ENHANCER_BY_FORMAT,
+        near_duplicates=NearDuplicateIndex(
+            config.CAPTION_CACHE_PATH or None,
+            max_distance=config.NEAR_DUPLICATE_MAX_DISTANCE,
+            max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+        ) if config.NEAR_DUPLICATE_INDEX else None,
+        stop_at_caption_end=config.GPT2_STOP_AT_CAPTION_END,
+        min_caption_chars=config.GPT2_MIN_CAPTION_CHARS,
+    )
+    generator.load_models(warm_up=config.MODEL_WARMUP)
+    return generator
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def decode_for_model(image_data):
+    """Upload decoded at model resolution, memoized so widget interactions don't decode it again
+
+    Raises UploadError for images over MAX_IMAGE_PIXELS, like the API.
+    """
+    from backend import config
+    from backend.image_io import load_image
+    return load_image(image_data, max_pixels=config.MAX_IMAGE_PIXELS)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def decode_for_preview(image_data):
+    """Upright preview of an upload no larger than UPLOAD_PREVIEW_SIZE, and the original (width, height)
+
+    The header is checked against MAX_IMAGE_PIXELS first (UploadError), so a
+    decompression bomb is never decoded.
+    """
+    from backend import config
+    from backend.image_io import probe_image
+    probe_image(image_data, config.MAX_IMAGE_PIXELS)
+    image = Image.open(io.BytesIO(image_data))
+    original_size = image.size
+    image.draft("RGB", (UPLOAD_PREVIEW_SIZE, UPLOAD_PREVIEW_SIZE))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((UPLOAD_PREVIEW_SIZE, UPLOAD_PREVIEW_SIZE))
+    return image, original_size
+
+@st.cache_resource
+def get_post_store():
+    """Saved posts of every planner, persisted across reruns and browser sessions"""
+    return PostStore(POST_STORE_PATH)
+
+def planner_id():
+    """Id of this browser session's planner, kept in the URL so reloads and bookmarks reopen it
+
+    The store is shared by every session of this Streamlit server; posts are
+    scoped to this id so users don't see or reorder each other's feeds.
+    """
+    if "planner_id" not in st.session_state:
+        requested = st.experimental_get_query_params().get("planner", [""])[0]
+        valid = len(requested) == 32 and all(c in "0123456789abcdef" for c in requested)
+        st.session_state.planner_id = requested if valid else uuid.uuid4().hex
+    st.experimental_set_query_params(planner=st.session_state.planner_id)
+    return st.session_state.planner_id
+
+def save_thumbnails(image_data):
+    """Write the grid and feed renditions of an image to the content-addressed cache; returns their paths
+
+    Files are named by the image's SHA-256, so saving the same image twice
+    reuses the existing renditions.
+    """
+    digest = hashlib.sha256(image_data).hexdigest()
+    grid_path, feed_path = thumbnail_paths(digest)
+    
+    if not (os.path.exists(grid_path) and os.path.exists(feed_path)):
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_data))).convert("RGB")
+        
+        # Square crop for the grid, like Instagram's profile grid
+        grid = ImageOps.fit(image, (GRID_THUMBNAIL_SIZE, GRID_THUMBNAIL_SIZE), Image.LANCZOS)
+        feed = image.copy()
+        feed.thumbnail((FEED_IMAGE_SIZE, FEED_IMAGE_SIZE), Image.LANCZOS)
+        
+        for rendition, path in ((grid, grid_path), (feed, feed_path)):
+            # Write then rename so a concurrent reader never sees a partial file
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            rendition.save(tmp_path, "JPEG", quality=85, optimize=True)
+            os.replace(tmp_path, path)
+    
+    return digest, grid_path, feed_path
+
+def thumbnail_paths(image_digest):
+    return [os.path.join(THUMBNAIL_DIR, f"{image_digest}_grid{GRID_THUMBNAIL_SIZE}.jpg"),
+            os.path.join(THUMBNAIL_DIR, f"{image_digest}_feed{FEED_IMAGE_SIZE}.jpg")]
+
+def remove_unused_thumbnails(image_digests):
+    """Delete cached renditions no saved post refers to any more"""
+    store = get_post_store()
+    for image_digest in image_digests:
+        if image_digest and not store.image_in_use(image_digest):
+            for path in thumbnail_paths(image_digest):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def post_image(post, rendition):
+    """Path of a saved post's grid or feed image, or None if it is gone from the cache"""
+    path = post.get(f"{rendition}_image_path")
+    return path if path and os.path.exists(path) else None
+
+def paginate(page_size, key):
+    """Saved posts on the current page, with previous/next controls stored under ``key``"""
+    store = get_post_store()
+    page_count = max(1, -(-store.count(planner_id()) // page_size))
+    page = min(st.session_state.get(key, 0), page_count - 1)
+    
+    if page_count > 1:
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Previous", key=f"{key}_prev", use_container_width=True, disabled=page == 0):
+                page -= 1
+        with col_next:
+            if st.button("Next ➡️", key=f"{key}_next", use_container_width=True, disabled=page == page_count - 1):
+                page += 1
+        with col_page:
+            st.caption(f"Page {page + 1} of {page_count}")
+    
+    st.session_state[key] = page
+    return store.page(planner_id(), page * page_size, page_size)
+
 def main():
     # Header with navigation
     st.markdown("""
@@ -209,13 +403,18 @@ def generator_tab():
         
         if uploaded_file is not None:
             # Display image
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Image", use_column_width=True)
-            
-            # Image info
-            st.info(f"📊 **Image Info**: {uploaded_file.name} | Size: {image.size[0]}x{image.size[1]} pixels")
-            
-            st.session_state.current_image = uploaded_file
+            try:
+                image, (width, height) = decode_for_preview(uploaded_file.getvalue())
+            except UploadError as e:
+                st.error(f"❌ Can't use this image: {e}")
+                st.session_state.current_image = None
+            else:
+                st.image(image, caption="Uploaded Image", use_column_width=True)
+                
+                # Image info
+                st.info(f"📊 **Image Info**: {uploaded_file.name} | Size: {width}x{height} pixels")
+                
+                st.session_state.current_image = uploaded_file
     
     with col2:
         st.header("🎯 Generate Caption")
@@ -231,23 +430,29 @@ def generator_tab():
             
             # Format selection
             format_options = ["casual", "formal", "funny", "trendy", "professional", "inspirational"]
-            selected_format = st.selectbox(
-                "Choose Caption Style",
+            selected_formats = st.multiselect(
+                "Choose Caption Styles",
                 format_options,
+                default=["casual"],
                 format_func=lambda x: x.title(),
-                help="Select the tone and style for your caption"
+                help="Select one or more tones and styles; all of them are generated at once"
             )
             
-            # Generate button
-            col_gen, col_regen = st.columns([2, 1])
+            # Generate buttons
+            col_gen, col_regen, col_all = st.columns([2, 1, 1])
             
             with col_gen:
-                if st.button("🚀 Generate Caption", type="primary", use_container_width=True):
-                    generate_caption_action(selected_format)
+                if st.button("🚀 Generate Caption", type="primary", use_container_width=True, disabled=not selected_formats):
+                    generate_caption_action(selected_formats)
             
             with col_regen:
-                if st.button("🔄 Regenerate", use_container_width=True, disabled=selected_format not in st.session_state.generated_captions):
-                    generate_caption_action(selected_format)
+                regenerable = [f for f in selected_formats if f in st.session_state.generated_captions]
+                if st.button("🔄 Regenerate", use_container_width=True, disabled=not regenerable):
+                    generate_caption_action(regenerable)
+            
+            with col_all:
+                if st.button("✨ All Styles", use_container_width=True):
+                    generate_caption_action(format_options)
             
             # Display generated captions
             if st.session_state.generated_captions:
@@ -308,7 +513,8 @@ def generator_tab():
 def preview_tab():
     st.header("📱 Instagram Preview & Organization")
     
-    if not st.session_state.saved_posts:
+    post_count = get_post_store().count(planner_id())
+    if not post_count:
         st.markdown("""
         <div style="text-align: center; padding: 4rem 2rem; background: #f8f9fa; border-radius: 10px; margin: 2rem 0;">
             <h3 style="color: #666; margin-bottom: 1rem;">No Posts Saved Yet</h3>
@@ -329,28 +535,21 @@ def preview_tab():
         )
     
     with col_stats:
-        st.metric("Saved Posts", len(st.session_state.saved_posts))
+        st.metric("Saved Posts", post_count)
     
     # Post organization controls
     st.subheader("🔄 Organize Your Posts")
     col_org1, col_org2, col_org3 = st.columns(3)
     
+    # Callbacks update the store before the rerun renders, so no extra st.rerun() is needed
     with col_org1:
-        if st.button("⬆️ Move First Post to End", use_container_width=True):
-            if st.session_state.saved_posts:
-                post = st.session_state.saved_posts.pop(0)
-                st.session_state.saved_posts.append(post)
-                st.rerun()
+        st.button("⬆️ Move First Post to End", use_container_width=True, on_click=get_post_store().move_first_to_end, args=(planner_id(),))
     
     with col_org2:
-        if st.button("🔄 Reverse Order", use_container_width=True):
-            st.session_state.saved_posts.reverse()
-            st.rerun()
+        st.button("🔄 Reverse Order", use_container_width=True, on_click=get_post_store().reverse, args=(planner_id(),))
     
     with col_org3:
-        if st.button("🗑️ Clear All Posts", use_container_width=True):
-            st.session_state.saved_posts = []
-            st.rerun()
+        st.button("🗑️ Clear All Posts", use_container_width=True, on_click=clear_posts_action)
     
     st.divider()
     
@@ -363,8 +562,8 @@ def preview_tab():
 def display_grid_view():
     st.subheader("📊 Instagram Grid Layout")
     
-    # Create grid layout (3 columns)
-    posts = st.session_state.saved_posts
+    # Create grid layout (3 columns), one page at a time
+    posts = paginate(GRID_PAGE_SIZE, "grid_page")
     
     for i in range(0, len(posts), 3):
         cols = st.columns(3)
@@ -373,8 +572,9 @@ def display_grid_view():
                 post = posts[i + j]
                 with col:
                     # Display image
-                    if post['image_data']:
-                        st.image(post['image_data'], use_column_width=True)
+                    thumbnail = post_image(post, 'grid')
+                    if thumbnail:
+                        st.image(thumbnail, use_column_width=True)
                     
                     # Post info
                     st.caption(f"**{post['format'].title()}** • {post['date']}")
@@ -386,8 +586,8 @@ def display_grid_view():
                             st.session_state[f"show_post_{post['id']}"] = True
                     
                     with col_btn2:
-                        if st.button("🗑️ Delete", key=f"delete_{post['id']}", use_container_width=True):
-                            delete_post_action(post['id'])
+                        st.button("🗑️ Delete", key=f"delete_{post['id']}", use_container_width=True,
+                                  on_click=delete_post_action, args=(post['id'],))
                     
                     # Show post details if requested
                     if st.session_state.get(f"show_post_{post['id']}", False):
@@ -409,7 +609,7 @@ def display_grid_view():
 def display_feed_view():
     st.subheader("📱 Instagram Feed Preview")
     
-    for post in st.session_state.saved_posts:
+    for post in paginate(FEED_PAGE_SIZE, "feed_page"):
         # Instagram-style post container
         st.markdown(f"""
         <div class="instagram-post">
@@ -428,8 +628,9 @@ def display_feed_view():
         """, unsafe_allow_html=True)
         
         # Image
-        if post['image_data']:
-            st.image(post['image_data'], use_column_width=True)
+        feed_image = post_image(post, 'feed')
+        if feed_image:
+            st.image(feed_image, use_column_width=True)
         
         # Actions and caption
         col_actions, col_format = st.columns([3, 1])
@@ -450,21 +651,21 @@ def display_feed_view():
                 st.success("Caption displayed above!")
         
         with col_delete:
-            if st.button("🗑️ Delete", key=f"feed_delete_{post['id']}", use_container_width=True):
-                delete_post_action(post['id'])
+            st.button("🗑️ Delete", key=f"feed_delete_{post['id']}", use_container_width=True,
+                      on_click=delete_post_action, args=(post['id'],))
         
         with col_move:
-            if st.button("⬆️ Move Up", key=f"feed_move_{post['id']}", use_container_width=True):
-                move_post_up(post['id'])
+            st.button("⬆️ Move Up", key=f"feed_move_{post['id']}", use_container_width=True,
+                      on_click=move_post_up, args=(post['id'],))
         
         st.divider()
 
-def generate_caption_action(format_type):
-    """Generate caption with loading animation"""
+def generate_caption_action(format_types):
+    """Generate captions for all selected formats at once with loading animation"""
     with st.spinner("🤖 AI is analyzing your image and creating the perfect caption..."):
         try:
-            caption = generate_caption_local(st.session_state.current_image, format_type)
-            st.session_state.generated_captions[format_type] = caption
+            captions = generate_captions(st.session_state.current_image, format_types)
+            st.session_state.generated_captions.update(captions)
             
             # Auto-copy if enabled
             if st.session_state.auto_copy:
@@ -478,39 +679,30 @@ def generate_caption_action(format_type):
 def save_post_action(caption, format_type):
     """Save post to preview collection"""
     if st.session_state.current_image:
-        # Convert image to base64
-        image_data = st.session_state.current_image.read()
-        st.session_state.current_image.seek(0)  # Reset file pointer
-        
-        post = {
-            'id': str(uuid.uuid4()),
-            'image_data': image_data,
-            'caption': caption,
-            'format': format_type,
-            'date': datetime.now().strftime("%b %d, %Y"),
-            'timestamp': time.time()
-        }
+        # The post store only keeps the thumbnails' paths
+        image_digest, grid_path, feed_path = save_thumbnails(st.session_state.current_image.getvalue())
         
-        st.session_state.saved_posts.append(post)
+        get_post_store().add(
+            planner_id(), caption, format_type, datetime.now().strftime("%b %d, %Y"),
+            image_digest, grid_path, feed_path
+        )
         st.success("💾 Post saved to Instagram preview!")
 
 def delete_post_action(post_id):
     """Delete post from saved collection"""
-    st.session_state.saved_posts = [
-        post for post in st.session_state.saved_posts 
-        if post['id'] != post_id
-    ]
-    st.success("🗑️ Post deleted!")
-    st.rerun()
+    post = get_post_store().delete(planner_id(), post_id)
+    if post is not None:
+        remove_unused_thumbnails([post['image_digest']])
+        st.session_state.pop(f"show_post_{post_id}", None)
+        st.toast("🗑️ Post deleted!")
+
+def clear_posts_action():
+    """Delete every saved post and its thumbnails"""
+    remove_unused_thumbnails(get_post_store().clear(planner_id()))
 
 def move_post_up(post_id):
     """Move post up in the feed"""
-    posts = st.session_state.saved_posts
-    for i, post in enumerate(posts):
-        if post['id'] == post_id and i > 0:
-            posts[i], posts[i-1] = posts[i-1], posts[i]
-            st.rerun()
-            break
+    get_post_store().move_up(planner_id(), post_id)
 
 def download_image_action():
     """Provide download functionality"""
@@ -523,46 +715,71 @@ def download_image_action():
         )
         st.session_state.current_image.seek(0)  # Reset file pointer
 
-def generate_caption_local(image_file, format_type):
-    """Generate caption using sample data (replace with actual AI when ready)"""
-    sample_captions = {
-        'casual': [
-            "Just captured this amazing moment! ✨ Living life one photo at a time 📸 #life #moments #vibes",
-            "Sometimes you just gotta stop and appreciate the beauty around you 💙 #grateful #blessed #goodvibes",
-            "Making memories that will last a lifetime 🌟 What's your favorite part of this shot? #memories #photography"
-        ],
-        'formal': [
-            "Pleased to share this meaningful experience. Grateful for these opportunities to capture beauty in everyday moments. #professional #quality #excellence",
-            "Reflecting on the profound impact that mindful observation can have on our daily perspective and appreciation. #reflection #mindfulness #growth",
-            "Today served as a reminder of the importance of taking time to document and celebrate life's significant moments. #documentation #celebration"
-        ],
-        'funny': [
-            "Me pretending I know what I'm doing while taking this photo 😅 Spoiler alert: I had no clue! #FakeItTillYouMakeIt #relatable #photography",
-            "Plot twist: I took 47 photos to get this one decent shot 🤷‍♀️ The struggle is real! #photographystruggles #authentic #reallife",
-            "Warning: This photo may contain traces of pure luck and accidental good timing 😂 #lucky #accidental #funny"
-        ],
-        'trendy': [
-            "Main character energy only ✨ Living my best life and serving looks 💅 #ThatGirl #MainCharacter #Aesthetic #Vibes",
-            "POV: You're living your dream life and it shows 🔥 No cap, this hits different #POV #DreamLife #NoFilter #Blessed",
-            "Caught in 4K living my best life 📸 This is what happiness looks like, periodt 💯 #Caught4K #Happiness #Periodt #Slay"
-        ],
-        'professional': [
-            "Celebrating another milestone in our journey toward excellence. Success is built on moments of dedication and unwavering commitment to our vision. #business #success #milestone #leadership",
-            "Behind every achievement lies countless hours of preparation, strategic thinking, and an unwavering belief in the power of persistence. #achievement #strategy #persistence #growth",
-            "Today marks another step forward in our commitment to delivering exceptional results and maintaining the highest standards of quality. #commitment #quality #results #standards"
-        ],
-        'inspirational': [
-            "Every great journey begins with a single step. What step will you take today to move closer to your dreams? 🌟 #inspiration #journey #dreams #motivation",
-            "Dreams don't work unless you do. Keep pushing forward, beautiful souls - your breakthrough is closer than you think! 💪 #dreams #hustle #breakthrough #believe",
-            "The only impossible journey is the one you never begin. Start where you are, use what you have, do what you can. ✨ #impossible #journey #start #possible"
-        ]
-    }
-    
-    # Simulate processing time
-    time.sleep(2)
-    
-    captions = sample_captions.get(format_type, sample_captions['casual'])
-    return captions[int(time.time()) % len(captions)]
+def generate_captions(image_file, format_types):
+    """Caption the image in the given formats with the configured CAPTION_BACKEND"""
+    if CAPTION_BACKEND == "local":
+        return generate_captions_local(image_file, format_types)
+    return generate_captions_remote(image_file, format_types)
+
+def generate_captions_local(image_file, format_types):
+    """Caption the image with the in-process CaptionGenerator, skipping the HTTP hop"""
+    from backend import config
+    from backend.cache import image_digest
+    
+    generator = get_local_caption_generator()
+    image_data = image_file.getvalue()
+    try:
+        image = decode_for_model(image_data)
+    except UploadError as e:
+        # Reported like the API's 413/415/400 answer in HTTP mode
+        raise RuntimeError(str(e))
+    image_key = image_digest(image_data)
+    format_types = list(dict.fromkeys(format_types))
+    
+    if len(format_types) == 1:
+        caption = generator.generate_caption(image, format_types[0], image_key=image_key, seed=config.CAPTION_SEED)
+        return {format_types[0]: caption}
+    return generator.generate_all_captions(image, format_types, image_key=image_key, seed=config.CAPTION_SEED)
+
+def post_to_backend(path, image_file, data):
+    """POST the uploaded image to the backend and return the JSON body, raising on failure"""
+    response = get_backend_session().post(
+        f"{BACKEND_URL}{path}",
+        files={"image": (image_file.name, image_file.getvalue(), image_file.type or "application/octet-stream")},
+        data=data,
+        timeout=(BACKEND_CONNECT_TIMEOUT, BACKEND_READ_TIMEOUT),
+    )
+    try:
+        result = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise RuntimeError(f"Unexpected response from backend ({response.status_code})")
+    if not result.get("success"):
+        raise RuntimeError(result.get("error") or f"Backend returned {response.status_code}")
+    return result
+
+def generate_caption_remote(image_file, format_type):
+    """Caption the image in one format via POST /generate-caption"""
+    return post_to_backend("/generate-caption", image_file, {"format_type": format_type})["caption"]
+
+def generate_captions_remote(image_file, format_types):
+    """Caption the image in several formats in about the time of one request
+
+    In ``all_formats`` mode the backend shares one BLIP pass and one batched
+    GPT-2 call across formats; in ``parallel`` mode one request per format is
+    sent concurrently over the pooled session.
+    """
+    format_types = list(dict.fromkeys(format_types))
+    if len(format_types) == 1:
+        return {format_types[0]: generate_caption_remote(image_file, format_types[0])}
+    
+    if MULTI_FORMAT_MODE == "all_formats":
+        result = post_to_backend("/generate-all-captions", image_file, {"formats": ",".join(format_types)})
+        return result["captions"]
+    
+    with ThreadPoolExecutor(max_workers=len(format_types)) as executor:
+        captions = executor.map(lambda f: generate_caption_remote(image_file, f), format_types)
+        return dict(zip(format_types, captions))
 
 if __name__ == "__main__":
     main()
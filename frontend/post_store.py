@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+POST_COLUMNS = ("id", "rank", "caption", "format", "date", "created_at", "image_digest", "grid_image_path", "feed_image_path")
+
+
+class PostStore:
+    """Saved posts of the preview planner in SQLite, ordered by a sortable rank
+
+    Every post belongs to one ``owner`` (a planner id) and every method only
+    sees that owner's posts, so users of a shared frontend never read or
+    reorder each other's feeds. Images stay in the thumbnail cache, which is
+    shared by all owners; rows only hold their paths. Posts are indexed by id
+    and by (owner, rank), so appending, moving and deleting a post touch one
+    or two rows, and a page of the grid or feed is one indexed range query.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS posts ("
+            "id TEXT PRIMARY KEY, rank REAL NOT NULL, caption TEXT NOT NULL, format TEXT NOT NULL, "
+            "date TEXT NOT NULL, created_at REAL NOT NULL, image_digest TEXT, "
+            "grid_image_path TEXT, feed_image_path TEXT, owner TEXT NOT NULL DEFAULT '')"
+        )
+        # Stores created before posts had owners
+        if "owner" not in [row[1] for row in self._db.execute("PRAGMA table_info(posts)")]:
+            self._db.execute("ALTER TABLE posts ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._db.execute("DROP INDEX IF EXISTS posts_rank")
+        self._db.execute("CREATE INDEX IF NOT EXISTS posts_owner_rank ON posts (owner, rank)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS posts_image_digest ON posts (image_digest)")
+        self._db.commit()
+
+    def _row(self, row) -> Dict:
+        return dict(zip(POST_COLUMNS, row))
+
+    def _last_rank(self, owner: str) -> float:
+        return self._db.execute("SELECT COALESCE(MAX(rank), 0) FROM posts WHERE owner = ?", (owner,)).fetchone()[0]
+
+    def add(self, owner: str, caption: str, format_type: str, date: str, image_digest: str, grid_image_path: str, feed_image_path: str) -> str:
+        """Append a post at the end of the owner's feed and return its id"""
+        post_id = str(uuid.uuid4())
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO posts ({', '.join(POST_COLUMNS)}, owner) VALUES ({', '.join('?' * (len(POST_COLUMNS) + 1))})",
+                (post_id, self._last_rank(owner) + 1, caption, format_type, date, time.time(),
+                 image_digest, grid_image_path, feed_image_path, owner)
+            )
+            self._db.commit()
+        return post_id
+
+    def get(self, owner: str, post_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(POST_COLUMNS)} FROM posts WHERE id = ? AND owner = ?", (post_id, owner)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def count(self, owner: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM posts WHERE owner = ?", (owner,)).fetchone()[0]
+
+    def page(self, owner: str, offset: int, limit: int) -> List[Dict]:
+        """Posts in feed order, ``limit`` of them starting at ``offset``"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(POST_COLUMNS)} FROM posts WHERE owner = ? ORDER BY rank, id LIMIT ? OFFSET ?",
+                (owner, limit, offset)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def delete(self, owner: str, post_id: str) -> Optional[Dict]:
+        """Remove a post; returns it, or None if the owner has no such post"""
+        post = self.get(owner, post_id)
+        if post is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM posts WHERE id = ? AND owner = ?", (post_id, owner))
+                self._db.commit()
+        return post
+
+    def image_in_use(self, image_digest: str) -> bool:
+        """Whether any owner's post still uses the image (thumbnails are shared)"""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM posts WHERE image_digest = ? LIMIT 1", (image_digest,)).fetchone() is not None
+
+    def move_up(self, owner: str, post_id: str) -> bool:
+        """Swap a post's rank with the one before it"""
+        with self._lock:
+            row = self._db.execute("SELECT rank FROM posts WHERE id = ? AND owner = ?", (post_id, owner)).fetchone()
+            if row is None:
+                return False
+            previous = self._db.execute(
+                "SELECT id, rank FROM posts WHERE owner = ? AND rank < ? ORDER BY rank DESC LIMIT 1", (owner, row[0])
+            ).fetchone()
+            if previous is None:
+                return False
+            self._db.execute("UPDATE posts SET rank = ? WHERE id = ?", (previous[1], post_id))
+            self._db.execute("UPDATE posts SET rank = ? WHERE id = ?", (row[0], previous[0]))
+            self._db.commit()
+        return True
+
+    def move_first_to_end(self, owner: str) -> bool:
+        with self._lock:
+            first = self._db.execute("SELECT id FROM posts WHERE owner = ? ORDER BY rank LIMIT 1", (owner,)).fetchone()
+            if first is None:
+                return False
+            self._db.execute("UPDATE posts SET rank = ? WHERE id = ?", (self._last_rank(owner) + 1, first[0]))
+            self._db.commit()
+        return True
+
+    def reverse(self, owner: str):
+        """Reverse the owner's feed order (negating every rank is the one operation that touches all their rows)"""
+        with self._lock:
+            self._db.execute("UPDATE posts SET rank = -rank WHERE owner = ?", (owner,))
+            self._db.commit()
+
+    def clear(self, owner: str) -> List[str]:
+        """Delete every post of the owner; returns the image digests they used"""
+        with self._lock:
+            digests = [
+                row[0] for row in self._db.execute(
+                    "SELECT DISTINCT image_digest FROM posts WHERE owner = ? AND image_digest IS NOT NULL", (owner,)
+                )
+            ]
+            self._db.execute("DELETE FROM posts WHERE owner = ?", (owner,))
+            self._db.commit()
+        return digests
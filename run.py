@@ -18,6 +18,15 @@ def run_api():
     cmd = ["uvicorn", "backend.api:app", "--host", "0.0.0.0", "--port", "8000", "--reload"]
     subprocess.run(cmd)
 
+def run_prefork(workers=None, threads=None):
+    """Run the FastAPI backend as pre-forked workers sharing one copy of the models"""
+    cmd = [sys.executable, "-m", "backend.prefork", "--host", "0.0.0.0", "--port", "8000"]
+    if workers:
+        cmd += ["--workers", str(workers)]
+    if threads:
+        cmd += ["--threads", str(threads)]
+    subprocess.run(cmd)
+
 def run_docker():
     """Run with Docker Compose"""
     cmd = ["docker-compose", "up", "--build"]
@@ -27,9 +36,11 @@ def main():
     parser = argparse.ArgumentParser(description="AI Caption Generator Runner")
     parser.add_argument(
         "mode", 
-        choices=["streamlit", "api", "docker"], 
+        choices=["streamlit", "api", "prefork", "docker"], 
         help="Choose how to run the application"
     )
+    parser.add_argument("--workers", type=int, help="Worker processes for prefork mode")
+    parser.add_argument("--threads", type=int, help="Torch threads per worker for prefork mode")
     
     args = parser.parse_args()
     
@@ -39,6 +50,9 @@ def main():
     elif args.mode == "api":
         print("🚀 Starting FastAPI backend...")
         run_api()
+    elif args.mode == "prefork":
+        print("🚀 Starting FastAPI backend with pre-forked workers...")
+        run_prefork(args.workers, args.threads)
     elif args.mode == "docker":
         print("🐳 Starting with Docker Compose...")
         run_docker()